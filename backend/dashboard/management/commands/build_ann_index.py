@@ -0,0 +1,51 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.ml.als import ALS_MODEL, ALSModel
+from dashboard.ml.ann import ANN_INDEX, build_ivf_index, item_destinations, recall_at
+from dashboard.ml.dataLoader import load_all_data
+from dashboard.ml.item_keys import ITEM_TYPES
+from dashboard.ml.model_store import load_model, save_model
+
+
+class Command(BaseCommand):
+    help = "Build the per (destination, item type) IVF index over the ALS item factors"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--list-size", type=int, default=32, help="target items per inverted list")
+        parser.add_argument("--nprobe", type=int, default=getattr(settings, "ML_ANN_NPROBE", 4),
+                            help="lists probed when reporting recall")
+        parser.add_argument("--eval-users", type=int, default=100, help="users sampled to report recall")
+        parser.add_argument("--dir", default=getattr(settings, "ML_MODEL_DIR", None),
+                            help="model directory (defaults to settings.ML_MODEL_DIR)")
+
+    def handle(self, *args, **options):
+        directory = options["dir"]
+        if not directory:
+            raise CommandError("No model directory, pass --dir or set ML_MODEL_DIR")
+        model = load_model(ALS_MODEL, ALSModel.load, directory)
+        if model is None:
+            raise CommandError("No ALS model yet, run `manage.py train_als` first")
+
+        destinations, _, places, activities, foods, hotels, _ = load_all_data()
+        destination_ids = item_destinations(model.item_keys, places, hotels, activities, foods)
+        index = build_ivf_index(model.item_keys, model.item_factors, destination_ids,
+                                list_size=options["list_size"], source_version=model.version)
+        path = save_model(ANN_INDEX, index.save, directory)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(index.keys)} partitions, {len(index.centroids)} lists, {len(index.item_keys)} items to {path}"))
+
+        # recall / latency of the chosen nprobe against exact search, on a sample of users
+        rng = np.random.default_rng(0)
+        queries = model.user_factors[rng.choice(len(model.user_factors),
+                                                min(options["eval_users"], len(model.user_factors)), replace=False)]
+        for destination_id in destinations["id"].head(5).tolist() if not destinations.empty else []:
+            for category in ITEM_TYPES[1:]:
+                start = time.perf_counter()
+                recall = recall_at(index, queries, destination_id, category, nprobe=options["nprobe"])
+                if recall is not None:
+                    self.stdout.write(f"destination {destination_id} {category}: recall@10 {recall:.3f} "
+                                      f"({(time.perf_counter() - start) / len(queries) * 1000:.2f} ms per exact+approx pair)")
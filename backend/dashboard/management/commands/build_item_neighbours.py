@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.ml.collaborative import ITEM_NEIGHBOURS_MODEL, calculate_item_neighbours
+from dashboard.ml.dataLoader import load_all_data
+from dashboard.ml.model_store import save_model
+from dashboard.ml.pipeline import user_item_matrix_from
+
+
+class Command(BaseCommand):
+    help = "Precompute the top-k most similar items of every item for item-based collaborative filtering"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--k", type=int, default=getattr(settings, "ML_CF_NEIGHBOURS", 50),
+                            help="neighbours kept per item")
+        parser.add_argument("--block-rows", type=int, default=1024,
+                            help="items whose similarities are computed at once (bounds memory)")
+        parser.add_argument("--dir", default=getattr(settings, "ML_MODEL_DIR", None),
+                            help="target directory (defaults to settings.ML_MODEL_DIR)")
+
+    def handle(self, *args, **options):
+        if not options["dir"]:
+            raise CommandError("No target directory, pass --dir or set ML_MODEL_DIR")
+
+        user_item_matrix = user_item_matrix_from(load_all_data()[-1])
+        neighbours = calculate_item_neighbours(user_item_matrix, k=options["k"], block_rows=options["block_rows"])
+
+        path = save_model(ITEM_NEIGHBOURS_MODEL, neighbours.save, options["dir"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote neighbours of {len(neighbours.item_keys)} items "
+            f"({len(neighbours.neighbour_keys)} pairs) to {path}"))
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.ml.mmap_snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the catalog and interaction columns as .npy files that recommender workers memory map"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dir",
+            default=getattr(settings, "ML_SNAPSHOT_DIR", None),
+            help="target directory (defaults to settings.ML_SNAPSHOT_DIR)",
+        )
+
+    def handle(self, *args, **options):
+        directory = options["dir"]
+        if not directory:
+            raise CommandError("No target directory, pass --dir or set ML_SNAPSHOT_DIR")
+        name = write_snapshot(directory)
+        self.stdout.write(self.style.SUCCESS(f"Wrote ML snapshot {name} to {directory}"))
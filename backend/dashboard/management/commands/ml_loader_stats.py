@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from dashboard.ml.dataLoader import load_all_data
+from dashboard.ml.instrumentation import loader_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Run the ML loader and report per-table wall time, rows, DataFrame memory and cache hits"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=2, help="load_all_data calls, the first one is cold (default 2)")
+        parser.add_argument("--json", action="store_true", help="print the raw stats as JSON")
+
+    def handle(self, *args, **options):
+        reset_stats()
+        for _ in range(max(options["runs"], 1)):
+            load_all_data()
+        stats = loader_stats()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+
+        self.stdout.write(f"{'table':<40} {'loads':>5} {'avg ms':>9} {'max ms':>9} {'rows':>9} {'KiB':>9} {'errors':>6}")
+        for label, table in stats["tables"].items():
+            self.stdout.write(
+                f"{label:<40} {table['loads']:>5} {table['avg_seconds'] * 1000:>9.1f} {table['max_seconds'] * 1000:>9.1f} "
+                f"{table['last_rows']:>9} {table['last_bytes'] / 1024:>9.1f} {table['errors']:>6}"
+            )
+        cache = stats["user_interaction_cache"]
+        self.stdout.write(f"user_interaction_cache: {cache['hits']} hits, {cache['misses']} misses")
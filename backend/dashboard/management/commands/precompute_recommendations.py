@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from dashboard.ml.dataLoader import load_all_data
+from dashboard.ml.collaborative import user_scores
+from dashboard.ml.pipeline import ITEM_TYPE_CONFIG, destination_items, model_version, scoring_inputs
+from dashboard.models import PrecomputedRecommendation
+
+# scoring inputs shared with the worker processes: set before the pool forks,
+# so the workers inherit them instead of unpickling the whole matrix per task
+_context = {}
+
+
+def _target_masks(scored):
+    """Candidate mask of every target over the scored items, reused while users share the same item array."""
+    cached = _context.get("masks")
+    if cached is None or cached[0] is not scored.item_keys:
+        cached = (scored.item_keys, [scored.candidate_mask(category, candidate_ids)
+                                     for _, _, category, candidate_ids in _context["targets"]])
+        _context["masks"] = cached
+    return cached[1]
+
+
+def _score_users(user_ids):
+    """(user_id, destination_id, item_type, ids) for every target of every user in the chunk."""
+    user_item_matrix, similarity = _context["user_item_matrix"], _context["similarity"]
+    rows = []
+    for user_id in user_ids:
+        # one score vector per user, every destination x item type is a slice of it
+        scored = user_scores(user_id, user_item_matrix, similarity)
+        if scored is None:
+            continue
+        for (destination_id, item_type, _, _), mask in zip(_context["targets"], _target_masks(scored)):
+            ids, _ = scored.top(_context["top_n"], mask)
+            if ids:
+                rows.append((user_id, destination_id, item_type, ids))
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Store the top-N recommendations of every active user x destination x item type"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scoring processes")
+        parser.add_argument("--chunk-size", type=int, default=200, help="users per task")
+        parser.add_argument("--top-n", type=int, default=10)
+        parser.add_argument("--keep-old", action="store_true",
+                            help="keep rows of other model versions instead of deleting them")
+
+    def handle(self, *args, **options):
+        destinations, _, places, activities, foods, hotels, user_interactions = load_all_data()
+        user_item_matrix, similarity = scoring_inputs(user_interactions)
+        version = model_version()
+
+        # users with at least one interaction, the others are served by clustering anyway
+        user_ids = [user_id for user_id in user_item_matrix.user_ids.tolist() if user_item_matrix.has_interactions(user_id)]
+        targets = []
+        for destination_id in destinations["id"].tolist() if not destinations.empty else []:
+            for item_type, (category, _) in ITEM_TYPE_CONFIG.items():
+                df = destination_items(places, hotels, foods, activities, destination_id, item_type)
+                if not df.empty:
+                    targets.append((destination_id, item_type, category, df["id"].to_numpy()))
+        _context.update(user_item_matrix=user_item_matrix, similarity=similarity, targets=targets,
+                        top_n=options["top_n"])
+
+        chunk_size = options["chunk_size"]
+        chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+        if options["workers"] > 1 and len(chunks) > 1:
+            # forked children must not share the parent's database sockets
+            connections.close_all()
+            with ProcessPoolExecutor(options["workers"], mp_context=multiprocessing.get_context("fork")) as pool:
+                written = sum(self.write(rows, version) for rows in pool.map(_score_users, chunks))
+        else:
+            written = sum(self.write(_score_users(chunk), version) for chunk in chunks)
+
+        if not options["keep_old"]:
+            PrecomputedRecommendation.objects.exclude(model_version=version).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {written} recommendation lists for {len(user_ids)} users ({version})"))
+
+    def write(self, rows, version):
+        now = timezone.now()
+        PrecomputedRecommendation.objects.bulk_create(
+            [PrecomputedRecommendation(user_id=user_id, destination_id=destination_id, item_type=item_type,
+                                       item_ids=ids, model_version=version, computed_at=now)
+             for user_id, destination_id, item_type, ids in rows],
+            update_conflicts=True,
+            unique_fields=["user", "destination", "item_type"],
+            update_fields=["item_ids", "model_version", "computed_at"],
+            batch_size=getattr(settings, "ML_PRECOMPUTE_BATCH", 1000),
+        )
+        return len(rows)
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.ml.als import ALS_MODEL, train_als
+from dashboard.ml.dataLoader import load_all_data
+from dashboard.ml.model_store import save_model
+from dashboard.ml.pipeline import user_item_matrix_from
+
+
+class Command(BaseCommand):
+    help = "Fit the implicit ALS user and item factors used when ML_CF_MODE is 'als'"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--factors", type=int, default=getattr(settings, "ML_ALS_FACTORS", 32))
+        parser.add_argument("--iterations", type=int, default=15)
+        parser.add_argument("--regularization", type=float, default=0.1)
+        parser.add_argument("--alpha", type=float, default=10.0, help="confidence per unit of interaction score")
+        parser.add_argument("--dir", default=getattr(settings, "ML_MODEL_DIR", None),
+                            help="target directory (defaults to settings.ML_MODEL_DIR)")
+
+    def handle(self, *args, **options):
+        if not options["dir"]:
+            raise CommandError("No target directory, pass --dir or set ML_MODEL_DIR")
+
+        user_item_matrix = user_item_matrix_from(load_all_data()[-1])
+        model = train_als(user_item_matrix, factors=options["factors"], regularization=options["regularization"],
+                          alpha=options["alpha"], iterations=options["iterations"])
+
+        path = save_model(ALS_MODEL, model.save, options["dir"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote ALS factors of {len(model.user_ids)} users and {len(model.item_keys)} items to {path}"))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.2 on 2026-10-18 16:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_alter_customuser_citizenship_number'),
+        ('dashboard', '0006_rename_rating_activity_avg_rating_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(max_length=20)),
+                ('item_ids', models.JSONField(default=list)),
+                ('model_version', models.CharField(max_length=64)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.destination')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'destination', 'item_type')},
+            },
+        ),
+    ]
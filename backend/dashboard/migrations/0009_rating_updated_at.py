@@ -0,0 +1,29 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def updated_at_from_created_at(apps, schema_editor):
+    Rating = apps.get_model('dashboard', 'Rating')
+    Rating.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0008_create_ml_generation_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rating',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(updated_at_from_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['updated_at', 'id'], name='dashboard_rating_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,189 @@
+# dashboard/ml/als.py
+
+import copy
+import time
+
+import numpy as np
+from scipy import sparse
+
+from .item_keys import ITEM_TYPE_CODES, key_type_codes, key_item_ids
+
+ALS_MODEL = "als.npz"  # file name in the model store
+
+
+class ALSModel:
+    """
+    User and item factor matrices of an implicit ALS fit (see train_als).
+    A user's score for an item is the dot product of their factors, so scoring
+    costs one matrix-vector product over the candidate items whatever the
+    number of users.
+    """
+
+    def __init__(self, user_ids, user_factors, item_keys, item_factors, version=None, alpha=10.0, regularization=0.1,
+                 gram=None):
+        self.version = float(version) if version is not None else time.time()  # identifies the fit, see ann.py
+        self.alpha = float(alpha)
+        self.regularization = float(regularization)
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.user_factors = np.asarray(user_factors, dtype=np.float32)
+        self.item_keys = np.asarray(item_keys, dtype=np.int64)  # sorted
+        self.item_factors = np.asarray(item_factors, dtype=np.float32)
+        self.item_types = key_type_codes(self.item_keys)
+        self.item_ids = key_item_ids(self.item_keys)
+        self.user_index = {user_id: row for row, user_id in enumerate(self.user_ids.tolist())}
+        # item positions of every type, computed once so a request only filters its own type
+        self.type_positions = {code: np.flatnonzero(self.item_types == code) for code in ITEM_TYPE_CODES.values()}
+        self._gram = gram
+
+    @property
+    def gram(self):
+        """YtY + regularization * I of the item factors, the same for every user solved, so computed once."""
+        if self._gram is None:
+            self._gram = _gram(self.item_factors.astype(np.float64), self.regularization)
+        return self._gram
+
+    def user_vector(self, user_id):
+        """Factors of a user, None if the user was not in the training data."""
+        row = self.user_index.get(user_id)
+        return None if row is None else self.user_factors[row]
+
+    def vector_for(self, user_id, item_keys, scores):
+        """
+        Factors of a user. Users missing from the fit (joined since) are solved
+        from their interactions (item_keys, scores), without keeping them. None
+        when the model knows none of their items.
+        """
+        vector = self.user_vector(user_id)
+        return vector if vector is not None else self.solve(item_keys, scores)
+
+    def solve(self, item_keys, scores):
+        """
+        Factors of a user solved from their current interactions against the
+        fixed item factors (one least squares step of the training, same alpha
+        and regularization), None when the model knows none of the items.
+        """
+        vector, known = self._solve(item_keys, scores)
+        return vector if known else None
+
+    def with_user_vector(self, user_id, vector):
+        """
+        Copy of the model that knows just one user, with the given factors (None:
+        none, vector_for then solves them). It shares everything of the item
+        side, so making one per request costs nothing.
+        """
+        model = copy.copy(self)
+        if vector is None:
+            model.user_ids, model.user_factors, model.user_index = self.user_ids[:0], self.user_factors[:0], {}
+        else:
+            model.user_ids = np.array([user_id], dtype=np.int64)
+            model.user_factors = np.asarray(vector, dtype=np.float32)[None, :]
+            model.user_index = {user_id: 0}
+        return model
+
+    def candidate_positions(self, category=None, candidate_ids=None):
+        """Item positions of the category (an item type name) and, if given, with an id in candidate_ids."""
+        if category:
+            positions = self.type_positions.get(ITEM_TYPE_CODES.get(category, -1), np.empty(0, dtype=np.int64))
+        else:
+            positions = np.arange(len(self.item_keys))
+        if candidate_ids is not None:
+            positions = positions[np.isin(self.item_ids[positions], np.asarray(candidate_ids, dtype=np.int64))]
+        return positions
+
+    def recommend(self, user_id, top_n=5, category=None, candidate_ids=None, exclude_keys=None, vector=None):
+        """
+        Top-N item positions and scores for a user, best first, items scoring 0
+        or less left out. exclude_keys are packed item keys to leave out (what
+        the user already interacted with), vector overrides the user's stored
+        factors (see vector_for).
+        """
+        vector = self.user_vector(user_id) if vector is None else vector
+        positions = self.candidate_positions(category, candidate_ids)
+        if vector is None or not len(positions):
+            return positions[:0], np.empty(0, dtype=np.float32)
+        if exclude_keys is not None and len(exclude_keys):
+            positions = positions[~np.isin(self.item_keys[positions], exclude_keys)]
+
+        scores = self.item_factors[positions] @ vector
+        # a predicted preference of 0 or less is no recommendation (see collaborative._top_n)
+        positions, scores = positions[scores > 0], scores[scores > 0]
+        if len(positions) > top_n:
+            top = np.argpartition(-scores, top_n - 1)[:top_n]
+            positions, scores = positions[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return positions[order], scores[order]
+
+    def _solve(self, item_keys, scores):
+        """(factors, number of items the model knows) for one user's interactions."""
+        item_keys = np.asarray(item_keys, dtype=np.int64)
+        pos = np.searchsorted(self.item_keys, item_keys).clip(max=max(len(self.item_keys) - 1, 0))
+        known = (self.item_keys[pos] == item_keys) if len(self.item_keys) else np.zeros(len(item_keys), dtype=bool)
+        n_known = int(known.sum())
+        confidence = sparse.csr_matrix(
+            (self.alpha * np.asarray(scores, dtype=np.float64)[known], pos[known], [0, n_known]),
+            shape=(1, len(self.item_keys)))
+        vector = _least_squares(confidence, self.item_factors, self.regularization, gram=self.gram)[0]
+        return vector.astype(np.float32), n_known
+
+    def save(self, path):
+        np.savez(path, user_ids=self.user_ids, user_factors=self.user_factors,
+                 item_keys=self.item_keys, item_factors=self.item_factors, version=self.version,
+                 alpha=self.alpha, regularization=self.regularization)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            version = float(data["version"]) if "version" in data.files else 0.0
+            hyper = {name: float(data[name]) for name in ("alpha", "regularization") if name in data.files}
+            return cls(data["user_ids"], data["user_factors"], data["item_keys"], data["item_factors"], version,
+                       **hyper)
+
+
+def _gram(fixed, regularization):
+    return fixed.T @ fixed + regularization * np.eye(fixed.shape[1])
+
+
+def _least_squares(confidence, fixed, regularization, gram=None):
+    """
+    One ALS half step: solve the factors of every row of confidence with the
+    other side fixed. Uses the YtY + Yu^T (Cu - I) Yu decomposition of Hu, Koren
+    and Volinsky, so each row only pays for the items it interacted with.
+    gram is _gram(fixed, regularization) when the caller already has it.
+    """
+    n_factors = fixed.shape[1]
+    if gram is None:
+        gram = _gram(fixed, regularization)
+    solved = np.zeros((confidence.shape[0], n_factors))
+    for row in range(confidence.shape[0]):
+        start, stop = confidence.indptr[row], confidence.indptr[row + 1]
+        if start == stop:
+            continue
+        cols = confidence.indices[start:stop]
+        extra = confidence.data[start:stop]   # Cu - 1 on the observed items
+        factors = fixed[cols].astype(np.float64)
+        a = gram + (factors.T * extra) @ factors
+        b = factors.T @ (1.0 + extra)         # preference is 1 on every observed item
+        solved[row] = np.linalg.solve(a, b)
+    return solved
+
+
+def train_als(user_item_matrix, factors=32, regularization=0.1, alpha=10.0, iterations=15, seed=0):
+    """
+    Implicit-feedback ALS over a UserItemMatrix: every stored score becomes a
+    preference of 1 with confidence 1 + alpha * score, missing pairs are
+    preference 0 with confidence 1. Returns an ALSModel.
+    """
+    confidence = user_item_matrix.matrix.astype(np.float64).tocsr()
+    confidence.data *= alpha
+    confidence_t = confidence.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    n_users, n_items = confidence.shape
+    user_factors = rng.normal(scale=0.01, size=(n_users, factors))
+    item_factors = rng.normal(scale=0.01, size=(n_items, factors))
+    for _ in range(iterations):
+        user_factors = _least_squares(confidence, item_factors, regularization)
+        item_factors = _least_squares(confidence_t, user_factors, regularization)
+
+    return ALSModel(user_item_matrix.user_ids, user_factors, user_item_matrix.item_keys, item_factors,
+                    alpha=alpha, regularization=regularization)
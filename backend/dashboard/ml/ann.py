@@ -0,0 +1,183 @@
+# dashboard/ml/ann.py
+
+import numpy as np
+import pandas as pd
+
+from .item_keys import ITEM_TYPES, ITEM_TYPE_CODES, key_type_codes, key_item_ids
+
+ANN_INDEX = "ann_index.npz"  # file name in the model store
+
+# a partition is one (destination, item type) pair, packed like the item keys
+PARTITION_SHIFT = 8
+
+
+def partition_keys(destination_ids, codes):
+    return (np.asarray(destination_ids, dtype=np.int64) << PARTITION_SHIFT) | np.asarray(codes, dtype=np.int64)
+
+
+def _ranges(starts, stops):
+    """Concatenation of range(start, stop) for every pair, without a python loop."""
+    lengths = stops - starts
+    if not lengths.sum():
+        return np.empty(0, dtype=np.int64)
+    return np.repeat(starts - np.cumsum(np.r_[0, lengths[:-1]]), lengths) + np.arange(lengths.sum())
+
+
+class IVFIndex:
+    """
+    Inverted file index over item vectors for maximum inner product search.
+    Every (destination, item type) partition has its own small k-means
+    codebook; a query scores the partition's centroids, opens the nprobe best
+    lists and ranks only the items in them exactly. nprobe is the recall /
+    latency knob: nprobe >= lists in a partition is an exact search.
+
+    Layout (all CSR style): partition p owns the lists
+    partition_offsets[p]:partition_offsets[p + 1], list l owns the items
+    list_offsets[l]:list_offsets[l + 1] of item_keys / vectors.
+    """
+
+    def __init__(self, keys, partition_offsets, centroids, list_offsets, item_keys, vectors, source_version=0.0):
+        self.keys = np.asarray(keys, dtype=np.int64)  # sorted partition keys
+        self.partition_offsets = np.asarray(partition_offsets, dtype=np.int64)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.item_keys = np.asarray(item_keys, dtype=np.int64)
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.source_version = float(source_version)  # version of the model the vectors come from
+
+    def lists_of(self, destination_id, category):
+        """List numbers of one (destination, item type name) partition."""
+        key = partition_keys(destination_id, ITEM_TYPE_CODES.get(category, -1))
+        pos = np.searchsorted(self.keys, key)
+        if pos == len(self.keys) or self.keys[pos] != key:
+            return np.empty(0, dtype=np.int64)
+        return np.arange(self.partition_offsets[pos], self.partition_offsets[pos + 1])
+
+    def search(self, vector, destination_id, category, top_n=10, nprobe=4, exclude_keys=None):
+        """(item keys, scores) of the top_n items of a partition for a query vector, best first."""
+        vector = np.asarray(vector, dtype=np.float32)
+        lists = self.lists_of(destination_id, category)
+        if not len(lists):
+            return self.item_keys[:0], np.empty(0, dtype=np.float32)
+
+        if nprobe < len(lists):
+            lists = lists[np.argpartition(-(self.centroids[lists] @ vector), nprobe - 1)[:nprobe]]
+        positions = _ranges(self.list_offsets[lists], self.list_offsets[lists + 1])
+        if exclude_keys is not None and len(exclude_keys):
+            positions = positions[~np.isin(self.item_keys[positions], exclude_keys)]
+
+        scores = self.vectors[positions] @ vector
+        if len(positions) > top_n:
+            top = np.argpartition(-scores, top_n - 1)[:top_n]
+            positions, scores = positions[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return self.item_keys[positions[order]], scores[order]
+
+    def similar_items(self, item_key, destination_id, top_n=10, nprobe=4):
+        """Items of the same type in a destination closest to one item, by inner product."""
+        pos = np.flatnonzero(self.item_keys == item_key)
+        if not len(pos):
+            return self.item_keys[:0], np.empty(0, dtype=np.float32)
+        category = ITEM_TYPES[key_type_codes(item_key)]
+        return self.search(self.vectors[pos[0]], destination_id, category, top_n, nprobe,
+                           exclude_keys=np.array([item_key], dtype=np.int64))
+
+    def save(self, path):
+        np.savez(path, keys=self.keys, partition_offsets=self.partition_offsets, centroids=self.centroids,
+                 list_offsets=self.list_offsets, item_keys=self.item_keys, vectors=self.vectors,
+                 source_version=self.source_version)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["keys"], data["partition_offsets"], data["centroids"], data["list_offsets"],
+                       data["item_keys"], data["vectors"], float(data["source_version"]))
+
+
+def _kmeans(vectors, n_lists, iterations, rng):
+    """Plain Lloyd k-means, returns (centroids, assignment)."""
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+    for _ in range(iterations):
+        distances = (vectors ** 2).sum(axis=1)[:, None] - 2 * vectors @ centroids.T + (centroids ** 2).sum(axis=1)
+        assignment = distances.argmin(axis=1)
+        counts = np.bincount(assignment, minlength=n_lists)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    distances = (vectors ** 2).sum(axis=1)[:, None] - 2 * vectors @ centroids.T + (centroids ** 2).sum(axis=1)
+    return centroids, distances.argmin(axis=1)
+
+
+def build_ivf_index(item_keys, vectors, destination_ids, list_size=32, iterations=10, seed=0, source_version=0.0):
+    """
+    Build an IVFIndex. destination_ids gives the destination of every item
+    (items without one, < 0, are left out). A partition gets about
+    len / list_size lists, so list_size trades build/probe cost for recall.
+    """
+    item_keys = np.asarray(item_keys, dtype=np.int64)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    destination_ids = np.asarray(destination_ids, dtype=np.int64)
+    keep = destination_ids >= 0
+    item_keys, vectors, destination_ids = item_keys[keep], vectors[keep], destination_ids[keep]
+
+    rng = np.random.default_rng(seed)
+    parts = partition_keys(destination_ids, key_type_codes(item_keys))
+    keys, inverse = np.unique(parts, return_inverse=True)
+
+    # item positions grouped by partition in one stable sort
+    grouped = np.argsort(inverse, kind="stable")
+    partitions = np.split(grouped, np.cumsum(np.bincount(inverse, minlength=len(keys)))[:-1]) if len(keys) else []
+
+    partition_offsets, list_offsets = [0], [0]
+    centroids, order = [], []
+    for members in partitions:
+        n_lists = max(1, int(round(len(members) / list_size)))
+        part_centroids, assignment = _kmeans(vectors[members], n_lists, iterations, rng)
+        for l in range(n_lists):
+            in_list = members[assignment == l]
+            order.append(in_list)
+            list_offsets.append(list_offsets[-1] + len(in_list))
+        centroids.append(part_centroids)
+        partition_offsets.append(partition_offsets[-1] + n_lists)
+
+    order = np.concatenate(order) if order else np.empty(0, dtype=np.int64)
+    n_factors = vectors.shape[1] if vectors.ndim == 2 else 0
+    centroids = np.concatenate(centroids) if centroids else np.empty((0, n_factors), dtype=np.float32)
+    return IVFIndex(keys, partition_offsets, centroids, list_offsets, item_keys[order], vectors[order],
+                    source_version)
+
+
+def item_destinations(item_keys, places, hotels, activities, foods):
+    """Destination id of every packed item key (-1 when unknown), from the catalog frames."""
+    codes, ids = key_type_codes(item_keys), key_item_ids(item_keys)
+    if places is None or "destination_id" not in places.columns:
+        places = pd.DataFrame({"id": [], "destination_id": []})
+    place_destination = pd.Series(places["destination_id"].to_numpy(), index=places["id"].to_numpy())
+    destinations = np.full(len(ids), -1, dtype=np.int64)
+
+    is_destination = codes == ITEM_TYPE_CODES["destination"]
+    destinations[is_destination] = ids[is_destination]
+    is_place = codes == ITEM_TYPE_CODES["place"]
+    destinations[is_place] = place_destination.reindex(ids[is_place]).fillna(-1).to_numpy(dtype=np.int64)
+    for item_type, df in (("hotel", hotels), ("activity", activities), ("food", foods)):
+        if df is None or "place_id" not in df.columns:
+            continue
+        is_type = codes == ITEM_TYPE_CODES[item_type]
+        item_place = pd.Series(df["place_id"].to_numpy(), index=df["id"].to_numpy())
+        place_ids = item_place.reindex(ids[is_type]).fillna(-1).to_numpy(dtype=np.int64)
+        destinations[is_type] = place_destination.reindex(place_ids).fillna(-1).to_numpy(dtype=np.int64)
+    return destinations
+
+
+def recall_at(index, queries, destination_id, category, top_n=10, nprobe=4):
+    """Mean overlap of the index results with an exact search (nprobe = every list) over query vectors."""
+    exhaustive = len(index.lists_of(destination_id, category))
+    hits = []
+    for vector in queries:
+        exact, _ = index.search(vector, destination_id, category, top_n, nprobe=exhaustive)
+        if not len(exact):
+            continue
+        approx, _ = index.search(vector, destination_id, category, top_n, nprobe=nprobe)
+        hits.append(len(np.intersect1d(exact, approx)) / len(exact))
+    return float(np.mean(hits)) if hits else None
@@ -1,8 +1,16 @@
 # dashboard/ml/clustering.py
 
+import logging
+import threading
+
+import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+from .model_store import load_model, model_path, save_model
+
+logger = logging.getLogger(__name__)
 
 def cluster_items(df, features, n_clusters=3, random_state=42):
     """
@@ -17,22 +25,23 @@ def cluster_items(df, features, n_clusters=3, random_state=42):
     """
     if df.empty:
         return df, None
-    
-    df_copy = df.copy()
+
+    # KMeans needs at least as many rows as clusters
+    n_clusters = min(n_clusters, len(df))
 
     # filling missing values with 0 as Kmeans cant handle NaNs
-    df_copy[features] = df_copy[features].fillna(0)
+    # (only the feature values are materialised, the frame itself is not copied)
+    values = df[features].fillna(0)
 
     # scaling the features 
     scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(df_copy[features])
+    scaled_features = scaler.fit_transform(values)
 
     # using KMeans to cluster
     kmeans = KMeans(n_clusters=n_clusters, random_state=random_state)
 
     # adds the column named cluster in the dataframe 
-    df_copy['cluster'] = kmeans.fit_predict(scaled_features)
-    return df_copy, kmeans
+    return df.assign(cluster=kmeans.fit_predict(scaled_features)), kmeans
 
 def add_cluster_badges(df, cluster_mapping):
     """
@@ -41,15 +50,253 @@ def add_cluster_badges(df, cluster_mapping):
         df (pd.DataFrame): DataFrame with 'cluster' column
         cluster_mapping (dict): {cluster_number: badge_name}
     """
-    df_copy = df.copy()
-    if 'cluster' in df_copy.columns:
-        df_copy['cluster_badge'] = df_copy['cluster'].map(cluster_mapping) # cluster mapping is the dictionary that maps the cluster numbers to human readable badges
-    else:
-        df_copy['cluster_badge'] = None
-    return df_copy
+    if 'cluster' in df.columns:
+        return df.assign(cluster_badge=df['cluster'].map(cluster_mapping)) # cluster mapping is the dictionary that maps the cluster numbers to human readable badges
+    return df.assign(cluster_badge=None)
    
 
-def cluster_for_dashboard(df, features, n_clusters=3, badge_mapping=None):
+# rows per chunk fed to the mini-batch fit, bounds its memory whatever the destination size
+FEATURE_CHUNK_ROWS = 4096
+
+
+def iter_feature_chunks(df, features, chunk_rows=FEATURE_CHUNK_ROWS):
+    """Feature values of df as float arrays of at most chunk_rows rows, NaN filled with 0."""
+    for start in range(0, len(df), chunk_rows):
+        chunk = df[features].iloc[start:start + chunk_rows].to_numpy(dtype=np.float64)
+        yield np.nan_to_num(chunk, nan=0.0)
+
+
+def fit_minibatch(make_chunks, n_clusters=3, random_state=42):
+    """
+    Streaming counterpart of cluster_items: make_chunks() returns a fresh
+    generator of feature chunks (see iter_feature_chunks), consumed twice, once
+    for the scaler and once for MiniBatchKMeans.partial_fit. Only one chunk is
+    held at a time. Returns (scaler, kmeans), kmeans is None without rows.
+    """
+    scaler = StandardScaler()
+    for chunk in make_chunks():
+        scaler.partial_fit(chunk)
+    n_rows = int(getattr(scaler, "n_samples_seen_", 0))
+    if not n_rows:
+        return scaler, None
+
+    kmeans = MiniBatchKMeans(n_clusters=min(n_clusters, n_rows), random_state=random_state, n_init=3)
+    for chunk in make_chunks():
+        kmeans.partial_fit(scaler.transform(chunk))
+    return scaler, kmeans
+
+
+class ClusterModel:
+    """
+    Fitted scaler and KMeans centroids of one destination's items of one type.
+    Centroids are ordered by the last feature (price_range, or avg_rating for
+    places), so cluster 0 is the cheapest and the badge mapping means something.
+    catalog_hash identifies the rows it was fitted on.
+    """
+
+    def __init__(self, features, mean, scale, centroids, catalog_hash, counts=None, ids=None):
+        self.features = list(features)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.centroids = np.asarray(centroids, dtype=np.float64)  # in scaled space
+        self.catalog_hash = int(catalog_hash)
+        # items per centroid and the (sorted) item ids seen, needed to add items incrementally
+        self.counts = np.zeros(len(self.centroids)) if counts is None else np.asarray(counts, dtype=np.float64)
+        self.ids = np.empty(0, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+
+    def _scaled(self, values):
+        return (values - self.mean) / self.scale
+
+    def assign_values(self, values):
+        """Nearest centroid of every row of a feature array."""
+        if not len(values) or not len(self.centroids):
+            return np.zeros(len(values), dtype=np.int32)
+        scaled = self._scaled(values)
+        distances = ((scaled[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+        return distances.argmin(axis=1).astype(np.int32)
+
+    def assign(self, df):
+        """Nearest centroid of every row, no fitting."""
+        if df.empty:
+            return np.zeros(0, dtype=np.int32)
+        return np.concatenate([self.assign_values(chunk) for chunk in iter_feature_chunks(df, self.features)])
+
+    def with_items(self, df, new_hash):
+        """
+        New model with the items of df added: every item moves its nearest
+        centroid towards it by 1 / (items in that cluster), the same online
+        update MiniBatchKMeans does, so nothing is refitted. The scaler is kept.
+        """
+        centroids, counts = self.centroids.copy(), self.counts.copy()
+        for chunk in iter_feature_chunks(df, self.features):
+            labels = self.assign_values(chunk)
+            added = np.bincount(labels, minlength=len(centroids)).astype(np.float64)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, self._scaled(chunk))
+            counts += added
+            filled = added > 0
+            centroids[filled] += (sums[filled] - added[filled, None] * centroids[filled]) / counts[filled, None]
+        order = np.argsort(centroids[:, -1], kind="stable")
+        return ClusterModel(self.features, self.mean, self.scale, centroids[order], new_hash, counts[order],
+                            np.union1d(self.ids, df["id"].to_numpy()))
+
+    def save(self, path):
+        np.savez(path, features=np.array(self.features), mean=self.mean, scale=self.scale,
+                 centroids=self.centroids, catalog_hash=np.uint64(self.catalog_hash),
+                 counts=self.counts, ids=self.ids)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            extra = {name: data[name] for name in ("counts", "ids") if name in data.files}
+            return cls(data["features"].tolist(), data["mean"], data["scale"], data["centroids"],
+                       int(data["catalog_hash"]), **extra)
+
+
+class TierModel:
+    """
+    Quantile cutpoints of one destination's items of one type over the last
+    feature (price_range, or avg_rating for places). Tiers are numbered from
+    the cheapest like the ClusterModel centroids, so the same badge mapping
+    applies; assigning them is one searchsorted, there is nothing to fit.
+    """
+
+    def __init__(self, features, cutpoints, catalog_hash):
+        self.features = list(features)
+        self.cutpoints = np.asarray(cutpoints, dtype=np.float64)  # ascending, n_tiers - 1 of them
+        self.catalog_hash = int(catalog_hash)
+
+    def assign(self, df):
+        """
+        Tier of every row, 0 is the cheapest. A value on a cutpoint stays in the
+        tier below it (the cheapest item is Budget even when the first cutpoint
+        is clamped to it), a value on several coinciding cutpoints (e.g. every
+        item has the same price) goes to the middle of the tiers they bound.
+        """
+        values = np.nan_to_num(df[self.features[-1]].to_numpy(dtype=np.float64), nan=0.0)
+        below = np.searchsorted(self.cutpoints, values, side="left")
+        up_to = np.searchsorted(self.cutpoints, values, side="right")
+        return ((below + up_to) // 2).astype(np.int32)
+
+    def save(self, path):
+        np.savez(path, features=np.array(self.features), cutpoints=self.cutpoints,
+                 catalog_hash=np.uint64(self.catalog_hash))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["features"].tolist(), data["cutpoints"], int(data["catalog_hash"]))
+
+
+def weighted_quantiles(values, weights, quantiles):
+    """
+    Values at the given fractions of the total weight, interpolated between
+    the distinct values, each placed at the middle of its weight (equal values
+    share one place). Six evenly spaced items of equal weight are cut at 2.5
+    and 4.5 for thirds; fractions outside the values are clamped to them.
+    """
+    distinct, inverse = np.unique(values, return_inverse=True)
+    group_weights = np.bincount(inverse, weights=weights)
+    cumulative = np.cumsum(group_weights)
+    middles = (cumulative - group_weights / 2.0) / cumulative[-1]
+    return np.interp(quantiles, middles, distinct)
+
+
+def fit_tier_model(df, features, n_tiers=3):
+    """
+    Cutpoints splitting the items into n_tiers of equal weight, every item
+    weighted by 1 + avg_rating so well rated items count for more than unrated
+    ones, e.g. the Luxury tier starts where the best rated third of the
+    price distribution does rather than at a plain item count.
+    """
+    if df.empty:
+        return TierModel(features, [], catalog_hash(df, features))
+    values = np.nan_to_num(df[features[-1]].to_numpy(dtype=np.float64), nan=0.0)
+    if "avg_rating" in df.columns:
+        weights = 1.0 + np.nan_to_num(df["avg_rating"].to_numpy(dtype=np.float64), nan=0.0).clip(min=0.0)
+    else:
+        weights = np.ones(len(values))
+    cutpoints = weighted_quantiles(values, weights, np.arange(1, n_tiers) / n_tiers)
+    return TierModel(features, cutpoints, catalog_hash(df, features))
+
+
+def catalog_hash(df, features):
+    """Hash of the ids and feature values a cluster model is fitted on."""
+    if df.empty:
+        return 0
+    return int(pd.util.hash_pandas_object(df[["id", *features]], index=False).sum()) & ((1 << 63) - 1)
+
+
+def fit_cluster_model(df, features, n_clusters=3, random_state=42, mode="kmeans"):
+    """
+    Fit once and keep only what assignment needs. mode "kmeans" is the full
+    batch fit of cluster_items, "minibatch" streams the items in chunks and
+    "quantile" returns price tier cutpoints (TierModel) instead of centroids.
+    """
+    if mode == "quantile":
+        return fit_tier_model(df, features, n_clusters)
+    ids = np.sort(df["id"].to_numpy()) if not df.empty else None
+    if mode == "minibatch":
+        scaler, kmeans = fit_minibatch(lambda: iter_feature_chunks(df, features), n_clusters, random_state)
+    else:
+        clustered, kmeans = cluster_items(df, features, n_clusters, random_state)
+        scaler = StandardScaler().fit(df[features].fillna(0)) if kmeans is not None else None
+    if kmeans is None:
+        return ClusterModel(features, np.zeros(len(features)), np.ones(len(features)),
+                            np.empty((0, len(features))), catalog_hash(df, features))
+
+    order = np.argsort(kmeans.cluster_centers_[:, -1], kind="stable")
+    model = ClusterModel(features, scaler.mean_, scaler.scale_, kmeans.cluster_centers_[order],
+                         catalog_hash(df, features), ids=ids)
+    model.counts = np.bincount(model.assign(df), minlength=len(model.centroids)).astype(np.float64)
+    return model
+
+
+# (destination_id, item_type, model kind) -> ClusterModel or TierModel last used by this process
+_models = {}
+_models_lock = threading.Lock()
+
+
+def cluster_model_for(destination_id, item_type, df, features, n_clusters=3, mode="kmeans"):
+    """
+    Cluster model of a destination's items of one type (df holds all of them).
+    Fitted once and stored under ML_MODEL_DIR, refitted only when the rows or
+    their feature values change. In "minibatch" mode items that were only
+    added are folded into the existing centroids instead of refitting, in
+    "quantile" mode a TierModel is cached the same way. None when df is
+    empty: nothing is fitted, stored or kept for a destination without items.
+    """
+    if df.empty:
+        return None
+    kind, model_class = ("tiers", TierModel) if mode == "quantile" else ("clusters", ClusterModel)
+    key = (destination_id, item_type, kind)
+    name = f"{kind}/{destination_id}-{item_type}.npz"
+    current = catalog_hash(df, features)
+
+    def fresh(model):
+        return model is not None and model.catalog_hash == current and model.features == list(features)
+
+    model = _models.get(key)
+    if not fresh(model) and model_path(name) is not None:
+        model = load_model(name, model_class.load)
+    if not fresh(model) and mode == "minibatch" and model is not None and model.features == list(features):
+        # only additions? then the rows the model knows hash exactly as before
+        known = df["id"].isin(model.ids)
+        if known.sum() == len(model.ids) and catalog_hash(df[known], features) == model.catalog_hash:
+            model = model.with_items(df[~known], current)
+    if not fresh(model):
+        model = fit_cluster_model(df, features, n_clusters, mode=mode)
+        if model_path(name) is not None:
+            try:
+                save_model(name, model.save)
+            except OSError:
+                logger.exception("Error saving cluster model %s", name)
+    with _models_lock:
+        _models[key] = model
+    return model
+
+
+def cluster_for_dashboard(df, features, n_clusters=3, badge_mapping=None, model=None, mode="kmeans"):
     """
     Full pipeline for dashboard: clustering + optional badges. i.e. like the main function
     it assigns the process to the functions
@@ -60,11 +307,20 @@ def cluster_for_dashboard(df, features, n_clusters=3, badge_mapping=None):
         features (list): Features to use for clustering.
         n_clusters (int): Number of clusters.
         badge_mapping (dict, optional): {cluster_number: badge_name}
+        model (ClusterModel or TierModel, optional): model from cluster_model_for,
+            items are then only assigned to its nearest centroid (or tier) instead of fitting
+        mode (str): "kmeans" (full batch), "minibatch" (chunked partial_fit) or
+            "quantile" (weighted price tiers, no fit), used when no model is given
 
     Returns:
         pd.DataFrame: Clustered DataFrame (with badges if provided)
     """
-    clustered_df, kmeans = cluster_items(df, features, n_clusters)
+    if model is None and mode in ("minibatch", "quantile"):
+        model = fit_cluster_model(df, features, n_clusters, mode=mode)
+    if model is not None:
+        clustered_df = df.assign(cluster=model.assign(df))
+    else:
+        clustered_df, kmeans = cluster_items(df, features, n_clusters)
     if badge_mapping:
         clustered_df = add_cluster_badges(clustered_df, badge_mapping)
     return clustered_df
@@ -1,146 +1,618 @@
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+
+from .als import ALSModel
+from .item_keys import ITEM_TYPES, ITEM_TYPE_CODES, type_codes, encode_item_keys, key_type_codes, key_item_ids
 
 # STEP 1: Build interaction dataframe
 
-def build_interactions(user_favorites, user_ratings, user_comments, destination_links, place_links):
+# interaction scores
+FAVORITE_SCORE = 5.0
+PROPAGATED_PLACE_SCORE = 3.0   # places of a favorite destination
+PROPAGATED_CHILD_SCORE = 2.5   # hotels/activities/foods of a favorite place or destination
+COMMENT_SCORE = 3.0
+
+# item type name of the children stored under each LinkIndex kind
+CHILD_ITEM_TYPES = {"hotels": "hotel", "activities": "activity", "foods": "food"}
+
+
+def _interaction_columns(records, *columns):
+    """Columns of a list of interaction dicts (or a frame) as arrays, empty arrays if there are none."""
+    df = records if isinstance(records, pd.DataFrame) else pd.DataFrame(records)
+    if df.empty:
+        return [np.empty(0, dtype=object if column == "item_type" else np.float64) for column in columns]
+    return [df[column].to_numpy() for column in columns]
+
+
+def _coo_part(rows, cols, codes, scores, counts):
+    return {
+        "user_id": np.asarray(rows, dtype=np.int64),
+        "item_id": np.asarray(cols, dtype=np.int64),
+        "code": np.broadcast_to(np.asarray(codes, dtype=np.int8), len(rows)),
+        "score": np.broadcast_to(np.asarray(scores, dtype=np.float32), len(rows)),
+        "count": np.broadcast_to(np.asarray(counts, dtype=np.float32), len(rows)),
+    }
+
+
+def _sparse_part(mat, user_ids, item_type, score):
+    """COO part for every stored entry of a users x item id matrix, the entry is the number of paths."""
+    coo = mat.tocoo()
+    return _coo_part(user_ids[coo.row], coo.col, ITEM_TYPE_CODES[item_type], score, coo.data)
+
+
+def build_interactions(user_favorites, user_ratings, user_comments, links):
     """
     Build user interactions based on favorites, ratings, and comments.
-    Propagates scores from destinations -> places -> activities/foods/hotels.
+    Propagates scores from destinations -> places -> activities/foods/hotels
+    as sparse products: favorites x destination->place x place->child adjacency
+    of the LinkIndex built by the data loader.
+
+    Returns one COO row per (user, item, source): score is the interaction score
+    and count how many interactions with that score it stands for (a hotel reached
+    through two favorites counts twice), so create_user_item_matrix averages
+    exactly as if every interaction was listed on its own.
+    Favorites, ratings and comments may be lists of dicts or frames.
     """
-    interactions = []
+    parts = []
 
     # ------------------------
     # FAVORITES
     # ------------------------
-    for fav in user_favorites:
-        user_id = fav['user_id']
-        item_id = fav['item_id']
-        item_type = fav['item_type']
-
-        # Favorite itself
-        interactions.append({
-            "user_id": user_id,
-            "item_id": item_id,
-            "item_type": item_type,
-            "score": 5.0
-        })
-
-        # If destination, propagate to related places, then their hotels/activities/foods
-        if item_type == "destination" and item_id in destination_links:
-            related_places = destination_links[item_id].get("places", [])
-            for place_id in related_places:
-                interactions.append({
-                    "user_id": user_id,
-                    "item_id": place_id,
-                    "item_type": "place",
-                    "score": 3.0
-                })
-
-                # Propagate hotels/activities/foods from place_links
-                place_related = place_links.get(place_id, {})
-                for hotel_id in place_related.get("hotels", []):
-                    interactions.append({
-                        "user_id": user_id,
-                        "item_id": hotel_id,
-                        "item_type": "hotel",
-                        "score": 2.5
-                    })
-                for activity_id in place_related.get("activities", []):
-                    interactions.append({
-                        "user_id": user_id,
-                        "item_id": activity_id,
-                        "item_type": "activity",
-                        "score": 2.5
-                    })
-                for food_id in place_related.get("foods", []):
-                    interactions.append({
-                        "user_id": user_id,
-                        "item_id": food_id,
-                        "item_type": "food",
-                        "score": 2.5
-                    })
-
-        # If place, propagate to its activities and foods
-        elif item_type == "place" and item_id in place_links:
-            place_related = place_links[item_id]
-            for hotel_id in place_related.get("hotels", []):
-                interactions.append({
-                    "user_id": user_id,
-                    "item_id": hotel_id,
-                    "item_type": "hotel",
-                    "score": 2.5
-                })
-            for activity_id in place_related.get("activities", []):
-                interactions.append({
-                    "user_id": user_id,
-                    "item_id": activity_id,
-                    "item_type": "activity",
-                    "score": 2.5
-                })
-            for food_id in place_related.get("foods", []):
-                interactions.append({
-                    "user_id": user_id,
-                    "item_id": food_id,
-                    "item_type": "food",
-                    "score": 2.5
-                })
+    fav_users, fav_items, fav_types = _interaction_columns(user_favorites, "user_id", "item_id", "item_type")
+    fav_codes = type_codes(fav_types)
+    parts.append(_coo_part(fav_users, fav_items, fav_codes, FAVORITE_SCORE, 1.0))
+
+    is_dest = fav_codes == ITEM_TYPE_CODES["destination"]
+    is_place = fav_codes == ITEM_TYPE_CODES["place"]
+    if links is not None and (is_dest.any() or is_place.any()):
+        fav_items = fav_items.astype(np.int64)
+        user_ids, user_rows = np.unique(fav_users[is_dest | is_place].astype(np.int64), return_inverse=True)
+        dest_rows, place_rows = user_rows[is_dest[is_dest | is_place]], user_rows[is_place[is_dest | is_place]]
+
+        # ids are used as matrix indices, the products only ever touch stored entries
+        dest_places = links.destination_places
+        n_dest = max(dest_places.max_parent(), int(fav_items[is_dest].max(initial=-1))) + 1
+        n_place = max([dest_places.max_child(), int(fav_items[is_place].max(initial=-1))]
+                      + [links.place_children[kind].max_parent() for kind in CHILD_ITEM_TYPES]) + 1
+
+        def favorites_matrix(rows, ids, n_cols):
+            ones = np.ones(len(rows), dtype=np.float32)
+            return sparse.csr_matrix((ones, (rows, ids)), shape=(len(user_ids), n_cols))
+
+        # users x places, entries count the paths (favorite destination -> place)
+        via_destination = favorites_matrix(dest_rows, fav_items[is_dest], n_dest) @ dest_places.matrix((n_dest, n_place))
+        parts.append(_sparse_part(via_destination, user_ids, "place", PROPAGATED_PLACE_SCORE))
+
+        # every place reached by a favorite, directly or through its destination
+        reached_places = via_destination + favorites_matrix(place_rows, fav_items[is_place], n_place)
+        for kind, item_type in CHILD_ITEM_TYPES.items():
+            relation = links.place_children[kind]
+            children = reached_places @ relation.matrix((n_place, relation.max_child() + 1))
+            parts.append(_sparse_part(children, user_ids, item_type, PROPAGATED_CHILD_SCORE))
 
     # RATINGS
 
-    for rate in user_ratings:
-        interactions.append({
-            "user_id": rate['user_id'],
-            "item_id": rate['item_id'],
-            "item_type": rate['item_type'],
-            "score": float(rate['rating'])
-        })
+    rate_users, rate_items, rate_types, rate_values = _interaction_columns(
+        user_ratings, "user_id", "item_id", "item_type", "rating")
+    parts.append(_coo_part(rate_users, rate_items, type_codes(rate_types), rate_values.astype(np.float32), 1.0))
 
     # COMMENTS
 
-    for comment in user_comments:
-        interactions.append({
-            "user_id": comment['user_id'],
-            "item_id": comment['item_id'],
-            "item_type": comment['item_type'],
-            "score": 3.0
-        })
+    comment_users, comment_items, comment_types = _interaction_columns(
+        user_comments, "user_id", "item_id", "item_type")
+    parts.append(_coo_part(comment_users, comment_items, type_codes(comment_types), COMMENT_SCORE, 1.0))
 
-    return pd.DataFrame(interactions)
+    codes = np.concatenate([part["code"] for part in parts])
+    return pd.DataFrame({
+        "user_id": np.concatenate([part["user_id"] for part in parts]),
+        "item_id": np.concatenate([part["item_id"] for part in parts]),
+        "item_type": pd.Categorical.from_codes(codes, categories=ITEM_TYPES),
+        "score": np.concatenate([part["score"] for part in parts]),
+        "count": np.concatenate([part["count"] for part in parts]),
+    })
 
 # STEP 2: Create user-item matrix
 
+class UserItemMatrix:
+    """
+    Sparse users x items score matrix (CSR) plus the id <-> row/column maps.
+    Only the interactions are stored, so memory follows the number of
+    interactions instead of users x items. Columns are packed item keys
+    (see item_keys), item_types holds the type code of every column.
+    """
+
+    def __init__(self, matrix, user_ids, item_keys):
+        self.matrix = matrix          # scipy.sparse.csr_matrix, float32
+        self.user_ids = user_ids      # row -> user id
+        self.item_keys = item_keys    # column -> packed (item_type, id) key
+        self.item_types = key_type_codes(item_keys)
+        self.item_ids = key_item_ids(item_keys)
+        self.user_index = {user_id: row for row, user_id in enumerate(user_ids.tolist())}
+        self.item_index = {item_key: col for col, item_key in enumerate(item_keys.tolist())}
+        self._normalized = None
+        self._normalized_by_item = None
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def normalized(self):
+        """The matrix with its rows scaled to unit length (same structure), computed once."""
+        if self._normalized is None:
+            self._normalized = _normalize_rows(self.matrix)
+        return self._normalized
+
+    @property
+    def normalized_by_item(self):
+        """normalized as CSC, the users of every item, computed once (see row_neighbours)."""
+        if self._normalized_by_item is None:
+            self._normalized_by_item = self.normalized.tocsc()
+        return self._normalized_by_item
+
+    def row_of(self, user_id):
+        """Row of a user, None if the user has no interactions."""
+        return self.user_index.get(user_id)
+
+    def seen_columns(self, row):
+        """Columns the user of this row already interacted with."""
+        return self.matrix.indices[self.matrix.indptr[row]:self.matrix.indptr[row + 1]]
+
+    def row_items(self, row):
+        """(item keys, scores) of the entries of one row."""
+        start, stop = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        return self.item_keys[self.matrix.indices[start:stop]], self.matrix.data[start:stop]
+
+    def has_interactions(self, user_id):
+        row = self.row_of(user_id)
+        return row is not None and self.matrix.indptr[row + 1] > self.matrix.indptr[row]
+
+    def candidate_mask(self, category=None, candidate_ids=None):
+        """
+        Boolean mask over the columns: items of the category (an item type name)
+        and, if given, with an id in candidate_ids.
+        """
+        mask = np.ones(len(self.item_keys), dtype=bool)
+        if category:
+            mask &= self.item_types == ITEM_TYPE_CODES.get(category, -1)
+        if candidate_ids is not None:
+            mask &= np.isin(self.item_ids, np.asarray(candidate_ids, dtype=np.int64))
+        return mask
+
+
+def rows_matrix(user_ids, rows):
+    """
+    UserItemMatrix of just the given users, rows[i] is the (item keys, scores)
+    of user_ids[i]: e.g. one user and their neighbours, enough to score that
+    user without the matrix of every user.
+    """
+    keys = np.concatenate([row_keys for row_keys, _ in rows]).astype(np.int64)
+    scores = np.concatenate([row_scores for _, row_scores in rows]).astype(np.float32)
+    item_keys = np.unique(keys)
+    indptr = np.concatenate([[0], np.cumsum([len(row_keys) for row_keys, _ in rows])])
+    matrix = sparse.csr_matrix((scores, np.searchsorted(item_keys, keys), indptr), shape=(len(rows), len(item_keys)))
+    return UserItemMatrix(matrix, np.asarray(user_ids, dtype=np.int64), item_keys)
+
+
 def create_user_item_matrix(interactions_df):
-    return interactions_df.pivot_table(
-        index="user_id",
-        columns="item_id",
-        values="score",
-        fill_value=0
-    )
+    """
+    Sparse equivalent of pivot_table(index=user_id, columns=item, values=score)
+    where an item is the (item_type, item_id) pair: repeated (user, item) pairs
+    are averaged (weighted by the count column of build_interactions when
+    present), missing pairs are simply not stored.
+    """
+    codes = type_codes(interactions_df["item_type"]) if not interactions_df.empty else np.empty(0, dtype=np.int8)
+    known = codes >= 0
+    if not known.any():
+        empty = sparse.csr_matrix((0, 0), dtype=np.float32)
+        return UserItemMatrix(empty, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    keys = encode_item_keys(codes[known], interactions_df["item_id"].to_numpy()[known])
+    user_ids, rows = np.unique(interactions_df["user_id"].to_numpy()[known], return_inverse=True)
+    item_keys, cols = np.unique(keys, return_inverse=True)
+    shape = (len(user_ids), len(item_keys))
+    scores = interactions_df["score"].to_numpy(dtype=np.float32)[known]
+    if "count" in interactions_df.columns:
+        weights = interactions_df["count"].to_numpy(dtype=np.float32)[known]
+    else:
+        weights = np.ones_like(scores)
+
+    # the CSR constructor sums duplicates, dividing by the pair counts gives the mean
+    sums = sparse.csr_matrix((scores * weights, (rows, cols)), shape=shape, dtype=np.float32)
+    counts = sparse.csr_matrix((weights, (rows, cols)), shape=shape, dtype=np.float32)
+    sums.sum_duplicates()
+    counts.sum_duplicates()
+    sums.data /= counts.data
+    return UserItemMatrix(sums, user_ids, item_keys)
 
 # STEP 3: Calculate user similarity
 
-def calculate_user_similarity(user_item_matrix):
-    mat = user_item_matrix.values.astype(float)
-    norms = np.linalg.norm(mat, axis=1)
+def _unit_length(values):
+    norm = np.sqrt(np.square(values, dtype=np.float64).sum())
+    return (values / norm).astype(values.dtype) if norm else values
+
+
+def _normalize_rows(mat):
+    """Rows scaled to unit length (empty rows stay zero), same sparsity structure as mat."""
+    mat = mat.tocsr()
+    norms = np.sqrt(np.asarray(mat.multiply(mat).sum(axis=1)).ravel())
     norms[norms == 0] = 1.0
-    sim = (mat @ mat.T) / (norms[:, None] * norms[None, :])
-    return pd.DataFrame(sim, index=user_item_matrix.index, columns=user_item_matrix.index)
+    data = (mat.data / np.repeat(norms, np.diff(mat.indptr))).astype(mat.dtype)
+    return sparse.csr_matrix((data, mat.indices, mat.indptr), shape=mat.shape)
+
+
+def calculate_user_similarity(user_item_matrix):
+    """
+    Cosine similarity between users as a sparse users x users matrix.
+    Only pairs of users that share at least one item get an entry.
+    """
+    normalized = user_item_matrix.normalized
+    return (normalized @ normalized.T).tocsr()
+
+
+USER_NEIGHBOURS_MODEL = "user_neighbours.npz"  # file name in the model store
+
+
+class UserNeighbours:
+    """
+    Top-k most similar users of every user, CSR style: the neighbours of
+    user_ids[i] are neighbour_ids[indptr[i]:indptr[i + 1]] with the matching
+    similarities. Neighbours are stored by user id, so a list built offline
+    still applies to a user-item matrix built later.
+    """
+
+    def __init__(self, user_ids, indptr, neighbour_ids, similarities):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.neighbour_ids = np.asarray(neighbour_ids, dtype=np.int64)
+        self.similarities = np.asarray(similarities, dtype=np.float32)
+        self.user_index = {user_id: pos for pos, user_id in enumerate(self.user_ids.tolist())}
+
+    def neighbours_of(self, user_id):
+        """(neighbour user ids, similarities) of a user, empty if unknown."""
+        pos = self.user_index.get(user_id)
+        if pos is None:
+            return self.neighbour_ids[:0], self.similarities[:0]
+        start, stop = self.indptr[pos], self.indptr[pos + 1]
+        return self.neighbour_ids[start:stop], self.similarities[start:stop]
+
+    def extended(self, other):
+        """New UserNeighbours with the lists of other's users added, none of them may be in self."""
+        return UserNeighbours(np.concatenate([self.user_ids, other.user_ids]),
+                              np.concatenate([self.indptr, self.indptr[-1] + other.indptr[1:]]),
+                              np.concatenate([self.neighbour_ids, other.neighbour_ids]),
+                              np.concatenate([self.similarities, other.similarities]))
+
+    def save(self, path):
+        np.savez(path, user_ids=self.user_ids, indptr=self.indptr,
+                 neighbour_ids=self.neighbour_ids, similarities=self.similarities)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["user_ids"], data["indptr"], data["neighbour_ids"], data["similarities"])
+
+
+def _top_k_neighbours(normalized, rows, k, block_rows):
+    """
+    Top-k cosine neighbours of the given rows of a row-normalized sparse matrix,
+    computed block_rows rows at a time so only one block of similarities is ever
+    held. Returns CSR style (indptr, neighbour rows, similarities), best first,
+    the row itself and non-positive similarities left out.
+    """
+    indptr = [0]
+    neighbour_rows, similarities = [], []
+    transposed = normalized.T.tocsc()
+    for start in range(0, len(rows), block_rows):
+        block_rows_idx = rows[start:start + block_rows]
+        block = (normalized[block_rows_idx] @ transposed).tocsr()
+        for i, row in enumerate(block_rows_idx.tolist()):
+            cols = block.indices[block.indptr[i]:block.indptr[i + 1]]
+            sims = block.data[block.indptr[i]:block.indptr[i + 1]]
+            keep = (cols != row) & (sims > 0)
+            cols, sims = cols[keep], sims[keep]
+            if len(sims) > k:
+                top = np.argpartition(-sims, k - 1)[:k]
+                cols, sims = cols[top], sims[top]
+            order = np.argsort(-sims, kind="stable")
+            neighbour_rows.append(cols[order])
+            similarities.append(sims[order])
+            indptr.append(indptr[-1] + len(order))
+
+    neighbour_rows = np.concatenate(neighbour_rows) if neighbour_rows else np.empty(0, dtype=np.int64)
+    similarities = np.concatenate(similarities) if similarities else np.empty(0, dtype=np.float32)
+    return indptr, neighbour_rows, similarities
+
+
+def _few_rows_neighbours(normalized, rows, k):
+    """
+    _top_k_neighbours for a handful of rows: one sparse x dense product per
+    row instead of transposing the whole matrix.
+    """
+    indptr = [0]
+    neighbour_rows, similarities = [], []
+    for row in rows.tolist():
+        sims = normalized @ normalized[row].toarray().ravel()
+        sims[row] = 0.0
+        cols = np.flatnonzero(sims > 0)
+        if len(cols) > k:
+            cols = cols[np.argpartition(-sims[cols], k - 1)[:k]]
+        cols = cols[np.argsort(-sims[cols], kind="stable")]
+        neighbour_rows.append(cols)
+        similarities.append(sims[cols].astype(np.float32))
+        indptr.append(indptr[-1] + len(cols))
+    neighbour_rows = np.concatenate(neighbour_rows) if neighbour_rows else np.empty(0, dtype=np.int64)
+    similarities = np.concatenate(similarities) if similarities else np.empty(0, dtype=np.float32)
+    return indptr, neighbour_rows, similarities
+
+
+# up to this many users are done row by row (e.g. the one user of a request)
+FEW_ROWS = 8
+
+
+def calculate_user_neighbours(user_item_matrix, k=50, block_rows=1024, user_ids=None):
+    """
+    Top-k cosine neighbours per user without ever holding the users x users matrix.
+    user_ids limits the work to those users (e.g. the one asking for
+    recommendations), by default every user is done, which is what the offline
+    build (manage.py build_user_neighbours) runs.
+    """
+    normalized = user_item_matrix.normalized
+    if user_ids is None:
+        rows = np.arange(normalized.shape[0])
+    else:
+        rows = np.array([row for row in map(user_item_matrix.row_of, user_ids) if row is not None], dtype=np.int64)
+
+    if len(rows) <= FEW_ROWS:
+        indptr, neighbour_rows, similarities = _few_rows_neighbours(normalized, rows, k)
+    else:
+        indptr, neighbour_rows, similarities = _top_k_neighbours(normalized, rows, k, block_rows)
+    return UserNeighbours(user_item_matrix.user_ids[rows], indptr,
+                          user_item_matrix.user_ids[neighbour_rows], similarities)
+
+
+def row_neighbours(user_item_matrix, item_keys, scores, k=50, exclude_user=None):
+    """
+    Top-k cosine neighbours among the users of user_item_matrix of a row given
+    as (item keys, scores), which need not be in the matrix (e.g. a user's row
+    after a new rating). Only the users of the row's items are read, through
+    normalized_by_item, so the cost follows how popular those items are rather
+    than the size of the matrix. Returns (neighbour user ids, similarities),
+    best first, exclude_user (the row's own user) left out.
+    """
+    item_keys = np.asarray(item_keys, dtype=np.int64)
+    unit = _unit_length(np.asarray(scores, dtype=np.float32))
+    cols = np.searchsorted(user_item_matrix.item_keys, item_keys)
+    known = cols < len(user_item_matrix.item_keys)
+    known[known] = user_item_matrix.item_keys[cols[known]] == item_keys[known]
+    if not known.any():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    by_item = user_item_matrix.normalized_by_item
+    cols, weights = cols[known], unit[known]
+    starts, stops = by_item.indptr[cols], by_item.indptr[cols + 1]
+    rows = np.concatenate([by_item.indices[start:stop] for start, stop in zip(starts, stops)])
+    values = np.concatenate([by_item.data[start:stop] * weight for start, stop, weight in zip(starts, stops, weights)])
+    rows, positions = np.unique(rows, return_inverse=True)
+    sims = np.bincount(positions, weights=values, minlength=len(rows))
+
+    keep = sims > 0
+    if exclude_user is not None:
+        keep &= user_item_matrix.user_ids[rows] != exclude_user
+    rows, sims = rows[keep], sims[keep]
+    if len(sims) > k:
+        top = np.argpartition(-sims, k - 1)[:k]
+        rows, sims = rows[top], sims[top]
+    order = np.argsort(-sims, kind="stable")
+    return user_item_matrix.user_ids[rows[order]], sims[order].astype(np.float32)
+
+
+ITEM_NEIGHBOURS_MODEL = "item_neighbours.npz"  # file name in the model store
+
+
+class ItemNeighbours:
+    """
+    Top-k most similar items of every item (cosine over the users' scores), CSR
+    style by packed item key like UserNeighbours. Built offline by
+    `manage.py build_item_neighbours`, scoring a user then only reads the lists
+    of the items in that user's history.
+    """
+
+    def __init__(self, item_keys, indptr, neighbour_keys, similarities):
+        self.item_keys = np.asarray(item_keys, dtype=np.int64)  # sorted
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.neighbour_keys = np.asarray(neighbour_keys, dtype=np.int64)
+        self.similarities = np.asarray(similarities, dtype=np.float32)
+
+    def neighbours_of(self, item_keys):
+        """
+        Neighbours of several items at once as (source position, neighbour keys,
+        similarities), source position indexing into item_keys. Unknown items
+        simply have no neighbours.
+        """
+        item_keys = np.asarray(item_keys, dtype=np.int64)
+        empty = (np.empty(0, dtype=np.int64), self.neighbour_keys[:0], self.similarities[:0])
+        if not len(self.item_keys):
+            return empty
+        pos = np.searchsorted(self.item_keys, item_keys).clip(max=len(self.item_keys) - 1)
+        known = np.flatnonzero(self.item_keys[pos] == item_keys)
+        starts, stops = self.indptr[pos[known]], self.indptr[pos[known] + 1]
+        lengths = stops - starts
+        if not lengths.sum():
+            return empty
+        # one flat index array over all the lists instead of a python loop
+        flat = np.repeat(starts - np.cumsum(np.r_[0, lengths[:-1]]), lengths) + np.arange(lengths.sum())
+        return np.repeat(known, lengths), self.neighbour_keys[flat], self.similarities[flat]
+
+    def save(self, path):
+        np.savez(path, item_keys=self.item_keys, indptr=self.indptr,
+                 neighbour_keys=self.neighbour_keys, similarities=self.similarities)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["item_keys"], data["indptr"], data["neighbour_keys"], data["similarities"])
+
+
+def calculate_item_neighbours(user_item_matrix, k=50, block_rows=1024):
+    """Top-k cosine neighbours of every item (column) of the user-item matrix."""
+    normalized = _normalize_rows(user_item_matrix.matrix.T.tocsr())
+    rows = np.arange(normalized.shape[0])
+    indptr, neighbour_rows, similarities = _top_k_neighbours(normalized, rows, k, block_rows)
+    return ItemNeighbours(user_item_matrix.item_keys, indptr,
+                          user_item_matrix.item_keys[neighbour_rows], similarities)
 
 # STEP 4: Get recommendations
 
 
-def get_recommendations(user_id, user_item_matrix, user_similarity, top_n=5, category=None):
-    if user_id not in user_item_matrix.index:
-        return []
+def _neighbour_scores(user_id, user_item_matrix, neighbours):
+    """Similarity weighted item scores from the k neighbours of a user only."""
+    neighbour_ids, sims = neighbours.neighbours_of(user_id)
+    rows = [user_item_matrix.row_of(neighbour_id) for neighbour_id in neighbour_ids.tolist()]
+    present = np.array([row is not None for row in rows], dtype=bool)
+    if not present.any():
+        return np.zeros(user_item_matrix.shape[1], dtype=np.float32)
+    rows = np.array([row for row in rows if row is not None], dtype=np.int64)
+    return np.asarray(user_item_matrix.matrix[rows].T @ sims[present]).ravel()
+
 
-    sims = user_similarity.loc[user_id]
-    weighted_scores = user_item_matrix.T.dot(sims)
-    already_seen = set(user_item_matrix.loc[user_id][user_item_matrix.loc[user_id] > 0].index)
-    recommendations = weighted_scores.drop(labels=list(already_seen), errors="ignore")
+def _top_n(columns, scores, top_n):
+    """
+    Positions in columns of the top_n highest scores, best first. Items scoring
+    0 or less are left out, nothing in the user's neighbourhood or history
+    points at them, so a user without any overlap gets an empty ranking.
+    """
+    columns = columns[scores[columns] > 0]
+    if len(columns) > top_n:
+        columns = columns[np.argpartition(-scores[columns], top_n - 1)[:top_n]]
+    return columns[np.argsort(-scores[columns], kind="stable")]
+
+
+def _item_based_recommendations(row, user_item_matrix, item_neighbours, top_n, category, candidate_ids,
+                                return_scores=False):
+    """
+    Item-based scores: every item in the user's history adds score x similarity
+    to each of its k neighbours. Cost is history x k, independent of the number of users.
+    """
+    history = user_item_matrix.seen_columns(row)
+    history_keys = user_item_matrix.item_keys[history]
+    history_scores = user_item_matrix.matrix.data[user_item_matrix.matrix.indptr[row]:user_item_matrix.matrix.indptr[row + 1]]
 
+    source, keys, sims = item_neighbours.neighbours_of(history_keys)
+    keys, positions = np.unique(keys, return_inverse=True)
+    scores = np.bincount(positions, weights=history_scores[source] * sims, minlength=len(keys))
+
+    candidates = ~np.isin(keys, history_keys)
     if category:
-        recommendations = recommendations[[item for item in recommendations.index if item.startswith(category)]]
+        candidates &= key_type_codes(keys) == ITEM_TYPE_CODES.get(category, -1)
+    if candidate_ids is not None:
+        candidates &= np.isin(key_item_ids(keys), np.asarray(candidate_ids, dtype=np.int64))
+
+    top = _top_n(np.flatnonzero(candidates), scores, top_n)
+    keys = keys[top]
+    items = key_item_ids(keys).tolist() if category else keys.tolist()
+    return (items, scores[top].tolist()) if return_scores else items
+
+
+def get_recommendations(user_id, user_item_matrix, user_similarity, top_n=5, category=None, candidate_ids=None,
+                        return_scores=False):
+    """
+    Top-N items for a user, best first.
+    user_similarity is either the users x users matrix of calculate_user_similarity,
+    a UserNeighbours (then only the k neighbours' rows are touched) or an
+    ItemNeighbours (then only the user's own row and the lists of those items are
+    read, so user_item_matrix may hold just this user) or an ALSModel (one dot
+    product of the user's factors with the candidates, the user's own row only
+    serves to leave out what they already know).
+    category restricts to one item type and returns item ids, without it the
+    packed item keys are returned. candidate_ids restricts to those item ids
+    (e.g. the items of the requested destination). With return_scores the
+    result is (items, scores), scores in the same order.
+    """
+    row = user_item_matrix.row_of(user_id)
+    if row is None:
+        return ([], []) if return_scores else []
+
+    if isinstance(user_similarity, ItemNeighbours):
+        return _item_based_recommendations(row, user_item_matrix, user_similarity, top_n, category, candidate_ids,
+                                           return_scores)
+
+    if isinstance(user_similarity, ALSModel):
+        seen_keys, seen_scores = user_item_matrix.row_items(row)
+        positions, scores = user_similarity.recommend(user_id, top_n, category, candidate_ids, exclude_keys=seen_keys,
+                                                      vector=user_similarity.vector_for(user_id, seen_keys, seen_scores))
+        items = (user_similarity.item_ids if category else user_similarity.item_keys)[positions].tolist()
+        return (items, scores.tolist()) if return_scores else items
+
+    if isinstance(user_similarity, UserNeighbours):
+        weighted_scores = _neighbour_scores(user_id, user_item_matrix, user_similarity)
+    else:
+        # similarity weighted sum of the other users' scores, only touches the
+        # rows of users that actually share items with this one
+        sims = user_similarity[row]
+        weighted_scores = np.asarray((sims @ user_item_matrix.matrix).todense()).ravel()
+
+    candidates = user_item_matrix.candidate_mask(category, candidate_ids)
+    candidates[user_item_matrix.seen_columns(row)] = False
+
+    columns = _top_n(np.flatnonzero(candidates), weighted_scores, top_n)
+    items = (user_item_matrix.item_ids if category else user_item_matrix.item_keys)[columns].tolist()
+    return (items, weighted_scores[columns].tolist()) if return_scores else items
+
+
+class UserScores:
+    """
+    Every item score of one user, computed once so that several item types and
+    candidate sets (e.g. every destination x item type of a batch run) are
+    ranked from the same vector instead of rescoring per target.
+    """
+
+    def __init__(self, item_keys, scores, seen_keys):
+        self.item_keys = item_keys
+        self.scores = scores
+        self.unseen = ~np.isin(item_keys, seen_keys)
+
+    def candidate_mask(self, category=None, candidate_ids=None):
+        """Boolean mask over item_keys, same meaning as UserItemMatrix.candidate_mask."""
+        mask = np.ones(len(self.item_keys), dtype=bool)
+        if category:
+            mask &= key_type_codes(self.item_keys) == ITEM_TYPE_CODES.get(category, -1)
+        if candidate_ids is not None:
+            mask &= np.isin(key_item_ids(self.item_keys), np.asarray(candidate_ids, dtype=np.int64))
+        return mask
+
+    def top(self, top_n, mask):
+        """(item ids, scores) of the top_n unseen items in mask, best first."""
+        columns = _top_n(np.flatnonzero(mask & self.unseen), self.scores, top_n)
+        return key_item_ids(self.item_keys[columns]).tolist(), self.scores[columns].tolist()
+
+
+def user_scores(user_id, user_item_matrix, user_similarity):
+    """
+    UserScores of a user for any similarity get_recommendations takes, None
+    when there is nothing to score from (no interactions, or an ALS model that
+    knows none of the user's items).
+    """
+    row = user_item_matrix.row_of(user_id)
+    if row is None:
+        return None
+    seen_keys, seen_scores = user_item_matrix.row_items(row)
+
+    if isinstance(user_similarity, ItemNeighbours):
+        source, keys, sims = user_similarity.neighbours_of(seen_keys)
+        keys, positions = np.unique(keys, return_inverse=True)
+        scores = np.bincount(positions, weights=seen_scores[source] * sims, minlength=len(keys))
+        return UserScores(keys, scores, seen_keys)
+
+    if isinstance(user_similarity, ALSModel):
+        vector = user_similarity.vector_for(user_id, seen_keys, seen_scores)
+        if vector is None:
+            return None
+        return UserScores(user_similarity.item_keys, user_similarity.item_factors @ vector, seen_keys)
 
-    return recommendations.sort_values(ascending=False).head(top_n).index.tolist()
+    if isinstance(user_similarity, UserNeighbours):
+        scores = _neighbour_scores(user_id, user_item_matrix, user_similarity)
+    else:
+        scores = np.asarray((user_similarity[row] @ user_item_matrix.matrix).todense()).ravel()
+    return UserScores(user_item_matrix.item_keys, scores, seen_keys)
@@ -1,130 +1,613 @@
 # dashboard/ml/db_loader.py
+import logging
+import numpy as np
 import pandas as pd
-import psycopg2
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 
-# ------------------------ DATABASE SETTINGS -------------------
-DB_NAME = "recommendation_system"
-DB_USER = "postgres"
-DB_PASSWORD = os.environ.get('POSTGRES_PASSWORD')
-DB_HOST = "localhost"
-DB_PORT = "5432"
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .instrumentation import record_cache, timed_load
+from .item_keys import ITEM_TYPES
+from .links import LinkIndex
+
+logger = logging.getLogger(__name__)
+
+# ------------------------ TABLE PROJECTIONS ------------------------
+# the recommender only needs ids, foreign keys, ratings and prices, so each table
+# is read with just those columns and stored with compact dtypes. The item tables
+# also carry what recommend_view shows (name, description, image...), so its
+# responses are built from the frames without going back to the ORM.
+# "columns" maps output column -> dtype (None keeps what the driver returns),
+# "select" overrides the SQL expression of a column and "join" adds to the FROM.
+CONTENT_TYPE_JOIN = "JOIN django_content_type ct ON ct.id = t.content_type_id"
+
+# fixed categories keep item_type codes stable (and equal to the item key type codes)
+ITEM_TYPE_DTYPE = pd.CategoricalDtype(ITEM_TYPES)
+
+# tables the catalog (everything but the interactions) is made of
+CATALOG_TABLES = (
+    "accounts_destination", "accounts_destinationtype",
+    "dashboard_place", "dashboard_hotel", "dashboard_activity", "dashboard_food",
+)
+
+TABLE_SPECS = {
+    "accounts_destination": {
+        "columns": {"id": "int32", "name": None, "type_id": "int32"},
+    },
+    "accounts_destinationtype": {
+        "columns": {"id": "int32", "name": None},
+    },
+    "dashboard_place": {
+        "columns": {"id": "int32", "destination_id": "int32", "avg_rating": "float32",
+                    "name": None, "description": None, "image": None},
+    },
+    "dashboard_hotel": {
+        "columns": {"id": "int32", "place_id": "int32", "avg_rating": "float32", "price_range": "float32",
+                    "name": None, "description": None, "image": None},
+    },
+    "dashboard_activity": {
+        "columns": {"id": "int32", "place_id": "int32", "avg_rating": "float32", "price_range": "float32",
+                    "name": None, "description": None, "image": None, "duration": None},
+    },
+    "dashboard_food": {
+        "columns": {"id": "int32", "place_id": "int32", "avg_rating": "float32", "price_range": "float32",
+                    "name": None, "description": None, "image": None, "type": None},
+    },
+    # interactions are generic relations, item_type is the content type's model name
+    "dashboard_favorite": {
+        "columns": {"id": "int32", "user_id": "int32", "item_id": "int32", "item_type": ITEM_TYPE_DTYPE, "created_at": None},
+        "select": {"item_id": "t.object_id", "item_type": "ct.model"},
+        "join": CONTENT_TYPE_JOIN,
+    },
+    "dashboard_comment": {
+        "columns": {"id": "int32", "user_id": "int32", "item_id": "int32", "item_type": ITEM_TYPE_DTYPE, "created_at": None},
+        "select": {"item_id": "t.object_id", "item_type": "ct.model"},
+        "join": CONTENT_TYPE_JOIN,
+    },
+    # re-rating edits the row in place (update_or_create), so ratings are synced by updated_at
+    "dashboard_rating": {
+        "columns": {"id": "int32", "user_id": "int32", "item_id": "int32", "item_type": ITEM_TYPE_DTYPE,
+                    "rating": "float32", "created_at": None, "updated_at": None},
+        "select": {"item_id": "t.object_id", "item_type": "ct.model"},
+        "join": CONTENT_TYPE_JOIN,
+        "watermark": "updated_at",
+    },
+}
+
+def select_sql(table_name):
+    """SELECT ... FROM clause for a table following its projection spec (aliased as t)."""
+    spec = TABLE_SPECS.get(table_name)
+    if spec is None:
+        return f"SELECT t.* FROM {table_name} t"
+    overrides = spec.get("select", {})
+    columns = ", ".join(
+        f"{overrides[col]} AS {col}" if col in overrides else f"t.{col}"
+        for col in spec["columns"]
+    )
+    return f"SELECT {columns} FROM {table_name} t {spec.get('join', '')}".rstrip()
+
+def apply_dtypes(df, table_name):
+    """Cast the projected columns of a frame to the compact dtypes of its spec."""
+    spec = TABLE_SPECS.get(table_name)
+    if spec is None or df.empty:
+        return df
+    dtypes = {col: dtype for col, dtype in spec["columns"].items() if dtype and col in df.columns}
+    return df.astype(dtypes)
 
 # ------------------------ GLOBAL CACHE ------------------------
 user_interaction_cache = None  # stores interactions in memory
 
+# ------------------------ INCREMENTAL SYNC STATE ------------------------
+# instead of re-reading the interaction tables on every call we remember the newest
+# (created_at, id) we have seen per table, (updated_at, id) for ratings whose rows are
+# edited in place, and only fetch the rows new or changed after it
+INTERACTION_TABLES = {
+    "favorites": "dashboard_favorite",
+    "comments": "dashboard_comment",
+    "ratings": "dashboard_rating",
+}
+
+# aggregate compared against the synced rows to notice what the watermark cannot see:
+# deletes (and anything committed out of watermark order). It scans the table, so it
+# only runs every FINGERPRINT_INTERVAL seconds, not on every sync.
+# ratings are summed in hundredths so the float32 copy we hold compares exactly
+TABLE_FINGERPRINTS = {
+    "dashboard_favorite": "SELECT COUNT(*), 0 FROM dashboard_favorite",
+    "dashboard_comment": "SELECT COUNT(*), 0 FROM dashboard_comment",
+    "dashboard_rating": "SELECT COUNT(*), COALESCE(SUM(ROUND(rating * 100)), 0) FROM dashboard_rating",
+}
+
+FINGERPRINT_INTERVAL = getattr(settings, "ML_INTERACTION_CHECK_INTERVAL", getattr(settings, "ML_SNAPSHOT_TTL", 300))
+
+interaction_frames = {}      # table_name -> DataFrame of every row synced so far
+interaction_watermarks = {}  # table_name -> (watermark column, id) of the newest synced row
+interaction_checked = {}     # table_name -> time.monotonic() of the last fingerprint check
+_sync_lock = threading.Lock()
+
 # ------------------------ DATABASE CONNECTION ------------------------
-def get_connection():
-    """Return a new connection to PostgreSQL."""
-    return psycopg2.connect(
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        port=DB_PORT
-    )
+# the loader goes through Django's configured connection (kept open between
+# requests by CONN_MAX_AGE) instead of dialing PostgreSQL itself for every table
+_snapshot = threading.local()  # holds the cursor of the snapshot open in this thread
+
+@contextmanager
+def read_snapshot(snapshot_id=None):
+    """
+    Read every table inside one REPEATABLE READ, READ ONLY transaction so all
+    frames of a load see the same state of the database.
+    Nested calls join the snapshot that is already open, snapshot_id imports a
+    snapshot exported by another thread (see load_concurrently).
+    """
+    cursor = getattr(_snapshot, "cursor", None)
+    if cursor is not None:
+        yield cursor
+        return
+
+    # isolation can only be chosen before the first query of a transaction,
+    # inside someone else's atomic block we just read in theirs
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            if outermost:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                if snapshot_id is not None:
+                    cursor.execute("SET TRANSACTION SNAPSHOT %s", [snapshot_id])
+            _snapshot.cursor = cursor
+            _snapshot.exportable = outermost
+            try:
+                yield cursor
+            finally:
+                _snapshot.cursor = None
+
+def run_query(query, params=None):
+    """Run a SELECT in the current snapshot (or on its own) and return a DataFrame."""
+    with read_snapshot() as cursor:
+        # savepoint so one failing table does not abort the whole snapshot
+        with transaction.atomic():
+            cursor.execute(query, params)
+            columns = [col[0] for col in cursor.description]
+            return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+
+STREAM_CHUNK_ROWS = 10000  # rows per fetch from a server-side cursor
+
+def stream_query(query, params=None, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Yield the result of a SELECT as DataFrames of at most chunk_rows rows.
+    Rows come from a named (server-side) cursor inside the current snapshot,
+    so only one chunk of raw rows is ever held in memory.
+    """
+    with read_snapshot():
+        with transaction.atomic():
+            with connection.chunked_cursor() as cursor:
+                cursor.execute(query, params)
+                columns = None
+                while True:
+                    rows = cursor.fetchmany(chunk_rows)
+                    if columns is None:
+                        # a named cursor only knows its columns after the first fetch
+                        columns = [col[0] for col in cursor.description]
+                    if not rows:
+                        break
+                    yield pd.DataFrame.from_records(rows, columns=columns)
+
+def _column_values(series):
+    """
+    (numpy array, dtype) of a column of a cast chunk, what the preallocated columns
+    of load_table_streamed hold: categories as their codes, timestamps with a time
+    zone as UTC datetime64, anything else as its numpy values.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), dtype
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return series.to_numpy(dtype=f"datetime64[{dtype.unit}]"), dtype
+    return series.to_numpy(), dtype
+
+def _column_from(values, dtype):
+    """Column of dtype over the values _column_values produced."""
+    if isinstance(dtype, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(values, dtype=dtype)
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return pd.Series(values, copy=False).dt.tz_localize("UTC").dt.tz_convert(dtype.tz)
+    if values.dtype != dtype:
+        return pd.array(values, dtype=dtype)
+    return values
+
+def _count_rows(query, params):
+    # our queries end in their ORDER BY (if any), counting does not need the sort
+    query = query.rsplit(" ORDER BY ", 1)[0]
+    return int(run_query(f"SELECT COUNT(*) AS n FROM ({query}) AS counted", params)["n"].iloc[0])
+
+def load_table_streamed(table_name, query, params=None):
+    """
+    Load a (large) table chunk by chunk into columns allocated once: the rows
+    are counted first, in the same snapshot, then every chunk is cast to the
+    compact dtypes of its spec and copied into place before the next one is
+    fetched. The peak stays at the final frame plus one chunk (or plus one
+    timestamp column, which gets its time zone back in a copy at the end).
+    """
+    columns, dtypes, filled = None, None, 0
+    with read_snapshot():
+        n_rows = _count_rows(query, params)
+        for chunk in stream_query(query, params):
+            chunk = apply_dtypes(chunk, table_name)
+            values = {name: _column_values(chunk[name]) for name in chunk.columns}
+            stop = filled + len(chunk)
+            if columns is None:
+                dtypes = {name: dtype for name, (_, dtype) in values.items()}
+                columns = {name: np.empty(max(n_rows, stop), dtype=array.dtype) for name, (array, _) in values.items()}
+            elif stop > n_rows:
+                # rows committed after the count, only when read outside a REPEATABLE READ snapshot
+                n_rows = stop
+                columns = {name: np.concatenate([column[:filled], np.empty(stop - filled, dtype=column.dtype)])
+                           for name, column in columns.items()}
+            for name, (array, _) in values.items():
+                columns[name][filled:stop] = array
+            filled = stop
+
+    if columns is None:
+        names = list(TABLE_SPECS[table_name]["columns"]) if table_name in TABLE_SPECS else []
+        return pd.DataFrame(columns=names)
+    # one column at a time, so a column converted in a copy frees its buffer before the next one
+    frame = {}
+    for name in list(columns):
+        frame[name] = _column_from(columns.pop(name)[:filled], dtypes[name])
+    return pd.DataFrame(frame, copy=False)
+
+# ------------------------ CONCURRENT LOADING ------------------------
+# loads are dominated by round trips, so independent tables are read on a small
+# thread pool. Each worker has its own Django connection and imports the snapshot
+# of the calling thread, so the frames stay mutually consistent.
+LOADER_THREADS = getattr(settings, "ML_LOADER_THREADS", 4)
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=LOADER_THREADS, thread_name_prefix="ml-loader")
+            _executor_pid = os.getpid()
+        return _executor
+
+def _run_in_snapshot(snapshot_id, job):
+    # pool threads live on between loads, drop their connection once it is too old or broken
+    close_old_connections()
+    with read_snapshot(snapshot_id=snapshot_id):
+        return job()
+
+def load_concurrently(jobs):
+    """
+    Run loader jobs ({name: callable}) on the thread pool inside the snapshot
+    opened by the caller and return {name: result}.
+    Falls back to running them one after another when the snapshot cannot be
+    shared (no open snapshot, not PostgreSQL, or inside someone else's transaction).
+    """
+    cursor = getattr(_snapshot, "cursor", None)
+    if (cursor is None or not _snapshot.exportable or LOADER_THREADS <= 1
+            or connection.vendor != "postgresql" or len(jobs) <= 1):
+        return {name: job() for name, job in jobs.items()}
+
+    cursor.execute("SELECT pg_export_snapshot()")
+    snapshot_id = cursor.fetchone()[0]
+    executor = _get_executor()
+    futures = {name: executor.submit(_run_in_snapshot, snapshot_id, job) for name, job in jobs.items()}
+    # the exporting transaction has to stay open until every worker imported it
+    return {name: future.result() for name, future in futures.items()}
 
 # ------------------------ TABLE LOADER ------------------------
 def load_table(table_name):
-    """Load a table from DB as a Pandas DataFrame."""
-    try:
-        conn = get_connection()
-        df = pd.read_sql(f"SELECT * FROM {table_name}", conn)
-        conn.close()
-        return df
-    except Exception as e:
-        print(f"Error loading table {table_name}: {e}")
-        return pd.DataFrame()
+    """Load a table from DB as a Pandas DataFrame (projected columns, compact dtypes)."""
+    with timed_load(table_name) as timing:
+        try:
+            timing["df"] = apply_dtypes(run_query(select_sql(table_name)), table_name)
+        except Exception:
+            logger.exception("Error loading table %s", table_name)
+            return pd.DataFrame()
+        return timing["df"]
+
+def watermark_column(table_name):
+    """Column an interaction table is synced by, created_at unless its spec says otherwise."""
+    return TABLE_SPECS[table_name].get("watermark", "created_at")
+
+def load_table_since(table_name, watermark):
+    """
+    Load only the rows of an interaction table new or changed after the watermark.
+    watermark is a (watermark_column, id) tuple, None means load the whole table.
+    Returns None when the query fails so the caller can keep its current rows.
+    """
+    query, params = select_sql(table_name), None
+    column = watermark_column(table_name)
+    if watermark is not None:
+        query += f" WHERE (t.{column}, t.id) > (%s, %s)"
+        params = watermark
+    query += f" ORDER BY t.{column}, t.id"
+    with timed_load(f"{table_name}:{'full' if watermark is None else 'delta'}") as timing:
+        try:
+            timing["df"] = load_table_streamed(table_name, query, params)
+        except Exception:
+            logger.exception("Error loading new rows of %s", table_name)
+        return timing["df"]
+
+def load_table_fingerprint(table_name):
+    """Return (row_count, value_sum) of an interaction table as seen by the DB."""
+    with timed_load(f"{table_name}:fingerprint") as timing:
+        try:
+            timing["df"] = run_query(TABLE_FINGERPRINTS[table_name])
+        except Exception:
+            logger.exception("Error checking table %s", table_name)
+            return None
+        count, total = timing["df"].iloc[0]
+        return int(count), float(total)
+
+def _local_fingerprint(table_name, df):
+    """Same aggregate as TABLE_FINGERPRINTS but computed on the rows we hold."""
+    if table_name != "dashboard_rating" or df.empty:
+        return len(df), 0.0
+    return len(df), float(np.rint(df["rating"].to_numpy(dtype=np.float64) * 100).sum())
+
+def _watermark_of(table_name, df):
+    """Newest (watermark column, id) of a frame whose last row is the newest, None without one."""
+    column = watermark_column(table_name)
+    if df.empty or column not in df.columns:
+        return None
+    last = df.iloc[-1]
+    return pd.Timestamp(last[column]).to_pydatetime(), int(last["id"])
+
+def sync_interaction_table(table_name):
+    """
+    Bring one interaction table up to date.
+    Only rows new or changed after the stored watermark are fetched and merged by
+    id (a changed row replaces its old version). Every FINGERPRINT_INTERVAL seconds
+    the result is checked against the DB as well, when they disagree (rows were
+    deleted) the table is re-read in full once.
+    Returns True when the rows we hold changed.
+    """
+    watermark = interaction_watermarks.get(table_name)
+    current = interaction_frames.get(table_name)
+    if current is None:
+        watermark = None
+
+    delta = load_table_since(table_name, watermark)
+    if delta is None:
+        return False
+
+    if current is not None and delta.empty:
+        merged = current
+    elif current is None or current.empty:
+        merged = delta
+    else:
+        # the delta goes last, so the newest row stays the last one
+        merged = pd.concat([current[~current["id"].isin(delta["id"])], delta], ignore_index=True)
+
+    now = time.monotonic()
+    if watermark is None:
+        interaction_checked[table_name] = now  # just read in full
+    elif now - interaction_checked.get(table_name, float("-inf")) >= FINGERPRINT_INTERVAL:
+        interaction_checked[table_name] = now
+        remote = load_table_fingerprint(table_name)
+        if remote is not None and remote != _local_fingerprint(table_name, merged):
+            full = load_table_since(table_name, None)
+            if full is not None:
+                merged = full
+
+    changed = merged is not current
+    interaction_frames[table_name] = merged
+    interaction_watermarks[table_name] = _watermark_of(table_name, merged)
+    return changed
+
+def _empty_frame(table_name):
+    return pd.DataFrame(columns=list(TABLE_SPECS[table_name]["columns"]))
+
+def _interaction_frames():
+    """
+    Current synced frames keyed like user_interactions. They are handed out
+    as they are (build_interactions and the response builder take frames), a
+    sync replaces a frame instead of changing it, so treat them as read-only.
+    """
+    return {
+        key: interaction_frames.get(table_name, _empty_frame(table_name))
+        for key, table_name in INTERACTION_TABLES.items()
+    }
+
+def sync_user_interactions():
+    """Sync every interaction table, returns True if any of them changed."""
+    with _sync_lock:
+        changed = False
+        for table_name in INTERACTION_TABLES.values():
+            changed = sync_interaction_table(table_name) or changed
+        return changed
+
+def seed_interaction_state(frames):
+    """
+    Start the incremental sync from rows loaded elsewhere (e.g. an on-disk snapshot)
+    instead of the DB, frames maps table_name -> DataFrame sorted by (watermark_column, id).
+    """
+    with _sync_lock:
+        for table_name, df in frames.items():
+            interaction_frames[table_name] = df
+            interaction_watermarks[table_name] = _watermark_of(table_name, df)
+            interaction_checked.pop(table_name, None)  # checked against the DB on the next sync
+
+def synced_interactions(sync=True):
+    """Interaction frames of the synced state, fetching new rows first unless sync=False."""
+    if sync:
+        _load_with_interactions((), reset=False)
+    return _interaction_frames()
+
+def reset_interaction_sync():
+    """Forget all watermarks so the next sync re-reads the interaction tables."""
+    with _sync_lock:
+        interaction_frames.clear()
+        interaction_watermarks.clear()
+        interaction_checked.clear()
 
 # ------------------------ MERGE USER INTERACTIONS ------------------------
-def load_user_interactions(force_refresh=False):
+LINK_TABLES = ("dashboard_place", "dashboard_hotel", "dashboard_activity", "dashboard_food")
+
+def _load_with_interactions(table_names, reset):
     """
-    Load favorites + comments + ratings and build links.
-    Returns a dictionary matching recommend_view expectations.
+    Load table_names and sync every interaction table in one concurrent pass.
+    Returns ({table_name: frame}, True if the interaction rows changed).
     """
+    with read_snapshot(), _sync_lock:
+        if reset:
+            interaction_frames.clear()
+            interaction_watermarks.clear()
+            interaction_checked.clear()
+        jobs = {table_name: partial(load_table, table_name) for table_name in table_names}
+        jobs.update({table_name: partial(sync_interaction_table, table_name) for table_name in INTERACTION_TABLES.values()})
+        results = load_concurrently(jobs)
+    changed = any(results[table_name] for table_name in INTERACTION_TABLES.values())
+    return {table_name: results[table_name] for table_name in table_names}, changed
+
+def _cache_user_interactions(changed, links):
+    """Store the interaction frames (the same objects unless rows changed) with the given links."""
     global user_interaction_cache
+    if changed or user_interaction_cache is None:
+        frames = _interaction_frames()
+    else:
+        frames = {key: user_interaction_cache[key] for key in INTERACTION_TABLES}
+    user_interaction_cache = {**frames, "links": links}
+    return user_interaction_cache
+
+def load_user_interactions(force_refresh=False, incremental=True):
+    """
+    Load favorites + comments + ratings and build links.
+    Returns a dictionary of interaction frames (plus the links) matching recommend_view expectations.
 
+    With incremental=True a cached result is kept fresh by fetching only the
+    rows added since the last call (see sync_interaction_table), the links are
+    reused as they only depend on the catalog. force_refresh re-reads everything.
+    """
+    record_cache(user_interaction_cache is not None and not force_refresh)
     if user_interaction_cache is not None and not force_refresh:
+        if incremental:
+            _, changed = _load_with_interactions((), reset=False)
+            return _cache_user_interactions(changed, user_interaction_cache["links"])
         return user_interaction_cache
 
-    # Load tables
-    favorites = load_table("dashboard_favorite")
-    comments = load_table("dashboard_comment")
-    ratings = load_table("dashboard_rating")  # create this table if needed
-
-    # Convert to lists of dicts
-    favorites_list = favorites.to_dict(orient="records") if not favorites.empty else []
-    comments_list = comments.to_dict(orient="records") if not comments.empty else []
-    ratings_list = ratings.to_dict(orient="records") if not ratings.empty else []
-
-    # Load items for links
-    destinations = load_table("accounts_destination")
-    places = load_table("dashboard_place")
-    hotels = load_table("dashboard_hotel")
-    activities = load_table("dashboard_activity")
-    foods = load_table("dashboard_food")
-
-    # Build destination_links dictionary
-    destination_links_dict = {}
-    for dest_id in destinations["id"].tolist():
-        related_places = places[places["destination_id"] == dest_id]["id"].tolist()
-        related_hotels = hotels[hotels["place_id"].isin(related_places)]["id"].tolist()
-        related_activities = activities[activities["place_id"].isin(related_places)]["id"].tolist()
-        related_foods = foods[foods["place_id"].isin(related_places)]["id"].tolist()
-        destination_links_dict[dest_id] = (
-            [f"place_{pid}" for pid in related_places] +
-            [f"hotel_{hid}" for hid in related_hotels] +
-            [f"activity_{aid}" for aid in related_activities] +
-            [f"food_{fid}" for fid in related_foods]
-        )
-
-    # Build place_links dictionary
-    place_links_dict = {}
-    for place_id in places["id"].tolist():
-        related_hotels = hotels[hotels["place_id"] == place_id]["id"].tolist()
-        related_activities = activities[activities["place_id"] == place_id]["id"].tolist()
-        related_foods = foods[foods["place_id"] == place_id]["id"].tolist()
-        place_links_dict[place_id] = (
-            [f"hotel_{hid}" for hid in related_hotels] +
-            [f"activity_{aid}" for aid in related_activities] +
-            [f"food_{fid}" for fid in related_foods]
-        )
-
-    # Combine into dictionary
-    user_interaction_cache = {
-        "favorites": favorites_list,
-        "ratings": ratings_list,
-        "comments": comments_list,
-        "destination_links": destination_links_dict,
-        "place_links": place_links_dict
-    }
-
-    return user_interaction_cache
+    frames, _ = _load_with_interactions(LINK_TABLES, reset=True)
+    links = LinkIndex(*(frames[table_name] for table_name in LINK_TABLES))
+    return _cache_user_interactions(True, links)
 
 # ------------------------ LOAD ALL DATA ------------------------
+def merge_destination_types(destinations, destination_types):
+    """Merge destinations with destination_types if available."""
+    if destinations.empty or destination_types.empty:
+        return destinations
+    return destinations.merge(
+        destination_types,
+        left_on="type_id",
+        right_on="id",
+        suffixes=('', '_type')
+    )
+
 def load_all_data():
     """
     Load all required tables from PostgreSQL and user interactions.
+    Every distinct table is read once, concurrently, in one snapshot (see
+    load_concurrently), the links are built from the same catalog frames.
     Returns:
         tuple: destinations, destination_types, places, activities, foods, hotels, user_interactions
     """
-    destinations = load_table("accounts_destination")
-    destination_types = load_table("accounts_destinationtype")
-    places = load_table("dashboard_place")
-    activities = load_table("dashboard_activity")
-    foods = load_table("dashboard_food")
-    hotels = load_table("dashboard_hotel")
+    record_cache(user_interaction_cache is not None)
+    frames, changed = _load_with_interactions(CATALOG_TABLES, reset=user_interaction_cache is None)
+    destinations = frames["accounts_destination"]
+    destination_types = frames["accounts_destinationtype"]
+    places = frames["dashboard_place"]
+    activities = frames["dashboard_activity"]
+    foods = frames["dashboard_food"]
+    hotels = frames["dashboard_hotel"]
 
     # Load user interactions
-    user_interactions = load_user_interactions()
+    user_interactions = _cache_user_interactions(changed, LinkIndex(places, hotels, activities, foods))
+
+    destinations = merge_destination_types(destinations, destination_types)
+
+    return destinations, destination_types, places, activities, foods, hotels, user_interactions
+
+# ------------------------ DESTINATION SCOPED LOADING ------------------------
+# recommend_view only ever looks at one destination, this path reads just that
+# destination's items and the interactions that touch them so the cost follows
+# the size of one destination instead of the whole catalog
+DESTINATION_FILTERS = {
+    "accounts_destination": ("", "t.id = %(dest)s"),
+    "dashboard_place": ("", "t.destination_id = %(dest)s"),
+    "dashboard_hotel": ("JOIN dashboard_place p ON p.id = t.place_id", "p.destination_id = %(dest)s"),
+    "dashboard_activity": ("JOIN dashboard_place p ON p.id = t.place_id", "p.destination_id = %(dest)s"),
+    "dashboard_food": ("JOIN dashboard_place p ON p.id = t.place_id", "p.destination_id = %(dest)s"),
+}
+
+# every (item_type, item_id) that belongs to the destination, interactions are joined against it
+DESTINATION_SCOPE_JOIN = """
+    JOIN (
+        SELECT 'destination' AS item_type, %(dest)s AS item_id
+        UNION ALL
+        SELECT 'place', p.id FROM dashboard_place p WHERE p.destination_id = %(dest)s
+        UNION ALL
+        SELECT 'hotel', h.id FROM dashboard_hotel h
+            JOIN dashboard_place p ON p.id = h.place_id WHERE p.destination_id = %(dest)s
+        UNION ALL
+        SELECT 'activity', a.id FROM dashboard_activity a
+            JOIN dashboard_place p ON p.id = a.place_id WHERE p.destination_id = %(dest)s
+        UNION ALL
+        SELECT 'food', f.id FROM dashboard_food f
+            JOIN dashboard_place p ON p.id = f.place_id WHERE p.destination_id = %(dest)s
+    ) scope ON scope.item_type = ct.model AND scope.item_id = t.object_id
+"""
+
+def load_table_where(table_name, join, where, params, streamed=False):
+    """Load the projected columns of a table restricted by an extra join and WHERE clause."""
+    query = f"{select_sql(table_name)} {join} WHERE {where}" if where else f"{select_sql(table_name)} {join}"
+    with timed_load(f"{table_name}:scoped") as timing:
+        try:
+            if streamed:
+                timing["df"] = load_table_streamed(table_name, query, params)
+            else:
+                timing["df"] = apply_dtypes(run_query(query, params), table_name)
+        except Exception:
+            logger.exception("Error loading table %s", table_name)
+            return pd.DataFrame()
+        return timing["df"]
+
+def load_interactions_of(user_id):
+    """One user's favorites, ratings and comments (frames keyed like user_interactions), read in one snapshot."""
+    params = {"user": int(user_id)}
+    with read_snapshot():
+        return {
+            key: load_table_where(table_name, "", "t.user_id = %(user)s", params)
+            for key, table_name in INTERACTION_TABLES.items()
+        }
+
+def load_destination_data(destination_id):
+    """
+    Destination-scoped variant of load_all_data, read in one snapshot.
+    Returns the same tuple, with only that destination's items and the
+    interactions on them (or on the destination itself).
+    """
+    params = {"dest": int(destination_id)}
+    with read_snapshot():
+        frames = {
+            table_name: load_table_where(table_name, join, where, params)
+            for table_name, (join, where) in DESTINATION_FILTERS.items()
+        }
+        destination_types = load_table("accounts_destinationtype")
+        interactions = {
+            key: load_table_where(table_name, DESTINATION_SCOPE_JOIN, "", params, streamed=True)
+            for key, table_name in INTERACTION_TABLES.items()
+        }
 
-    # Merge destinations with destination_types if available
-    if not destinations.empty and not destination_types.empty:
-        destinations = destinations.merge(
-            destination_types,
-            left_on="type_id",
-            right_on="id",
-            suffixes=('', '_type')
-        )
+    places, hotels = frames["dashboard_place"], frames["dashboard_hotel"]
+    activities, foods = frames["dashboard_activity"], frames["dashboard_food"]
+    user_interactions = dict(interactions)
+    user_interactions["links"] = LinkIndex(places, hotels, activities, foods)
 
+    destinations = merge_destination_types(frames["accounts_destination"], destination_types)
     return destinations, destination_types, places, activities, foods, hotels, user_interactions
@@ -0,0 +1,93 @@
+# dashboard/ml/instrumentation.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# per process counters, every gunicorn worker keeps its own
+_lock = threading.Lock()
+_tables = {}                            # label -> stats dict, see _empty_stats
+_cache = {"hits": 0, "misses": 0}       # user_interaction_cache lookups
+_started = time.time()
+
+
+def _empty_stats():
+    return {
+        "loads": 0,
+        "errors": 0,
+        "total_seconds": 0.0,
+        "max_seconds": 0.0,
+        "last_seconds": 0.0,
+        "last_rows": 0,
+        "last_bytes": 0,
+        "total_rows": 0,
+    }
+
+
+def frame_bytes(df):
+    """Memory held by a DataFrame, 0 for None."""
+    if df is None:
+        return 0
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def record_load(label, seconds, df=None, error=False):
+    """Account one table read: wall time, rows and DataFrame memory."""
+    rows = 0 if df is None else len(df)
+    size = frame_bytes(df)
+    with _lock:
+        stats = _tables.setdefault(label, _empty_stats())
+        stats["loads"] += 1
+        stats["errors"] += int(error)
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        stats["last_seconds"] = seconds
+        stats["last_rows"] = rows
+        stats["last_bytes"] = size
+        stats["total_rows"] += rows
+
+
+@contextmanager
+def timed_load(label):
+    """
+    Time a table read. The body stores the loaded frame in the yielded dict under
+    "df" (leave it None on failure) so rows and bytes can be recorded.
+    """
+    result = {"df": None}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        record_load(label, time.perf_counter() - start, result["df"], error=result["df"] is None)
+
+
+def record_cache(hit):
+    """Count a user_interaction_cache hit or miss."""
+    with _lock:
+        _cache["hits" if hit else "misses"] += 1
+
+
+def loader_stats():
+    """JSON friendly copy of the counters, slowest tables first."""
+    with _lock:
+        tables = {label: dict(stats) for label, stats in _tables.items()}
+        cache = dict(_cache)
+    for stats in tables.values():
+        stats["avg_seconds"] = stats["total_seconds"] / stats["loads"] if stats["loads"] else 0.0
+    ordered = dict(sorted(tables.items(), key=lambda item: item[1]["total_seconds"], reverse=True))
+    lookups = cache["hits"] + cache["misses"]
+    return {
+        "pid": os.getpid(),
+        "since": _started,
+        "tables": ordered,
+        "user_interaction_cache": {**cache, "hit_rate": cache["hits"] / lookups if lookups else None},
+    }
+
+
+def reset_stats():
+    global _started
+    with _lock:
+        _tables.clear()
+        _cache.update(hits=0, misses=0)
+        _started = time.time()
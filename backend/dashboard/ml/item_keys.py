@@ -0,0 +1,37 @@
+# dashboard/ml/item_keys.py
+
+import numpy as np
+import pandas as pd
+
+# models an interaction can point at, the position is the type code
+ITEM_TYPES = ("destination", "place", "hotel", "food", "activity")
+ITEM_TYPE_CODES = {name: code for code, name in enumerate(ITEM_TYPES)}
+
+# an item key packs (type code, id) into one int64: code in the high 32 bits,
+# id in the low 32 bits, so hotel 3 and food 3 never share a key
+TYPE_SHIFT = 32
+ID_MASK = (1 << TYPE_SHIFT) - 1
+
+
+def type_codes(item_types):
+    """Type codes (int8) of item type names, -1 for unknown names."""
+    if isinstance(item_types, pd.Categorical) and tuple(item_types.categories) == ITEM_TYPES:
+        return item_types.codes.astype(np.int8)
+    if isinstance(item_types, pd.Series) and isinstance(item_types.dtype, pd.CategoricalDtype):
+        return type_codes(item_types.array)
+    return pd.Categorical(np.asarray(item_types, dtype=object), categories=ITEM_TYPES).codes.astype(np.int8)
+
+
+def encode_item_keys(codes, item_ids):
+    """Pack type codes and item ids into int64 keys."""
+    return (np.asarray(codes, dtype=np.int64) << TYPE_SHIFT) | np.asarray(item_ids, dtype=np.int64)
+
+
+def key_type_codes(keys):
+    """Type code of every key."""
+    return (np.asarray(keys, dtype=np.int64) >> TYPE_SHIFT).astype(np.int8)
+
+
+def key_item_ids(keys):
+    """Item id of every key."""
+    return np.asarray(keys, dtype=np.int64) & ID_MASK
@@ -0,0 +1,86 @@
+# dashboard/ml/links.py
+
+import numpy as np
+from scipy import sparse
+
+EMPTY_IDS = np.empty(0, dtype=np.int64)
+
+# child tables hanging off a place, keyed the same way build_interactions names them
+CHILD_KINDS = ("hotels", "activities", "foods")
+
+
+class Relation:
+    """
+    One parent -> children relation stored CSR style.
+    keys are the sorted distinct parent ids, the children of keys[i]
+    are ids[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, parent_ids, child_ids):
+        parent_ids = np.asarray(parent_ids, dtype=np.int64)
+        child_ids = np.asarray(child_ids, dtype=np.int64)
+
+        # one stable argsort groups every parent's children together
+        order = np.argsort(parent_ids, kind="stable")
+        sorted_parents = parent_ids[order]
+        self.ids = child_ids[order]
+
+        # a new group starts wherever the parent id changes
+        if len(sorted_parents):
+            starts = np.flatnonzero(np.r_[True, sorted_parents[1:] != sorted_parents[:-1]])
+        else:
+            starts = EMPTY_IDS
+        self.keys = sorted_parents[starts]
+        self.offsets = np.append(starts, len(sorted_parents)).astype(np.int64)
+
+    def get(self, parent_id):
+        """Child ids of one parent, empty array if it has none."""
+        pos = np.searchsorted(self.keys, parent_id)
+        if pos == len(self.keys) or self.keys[pos] != parent_id:
+            return EMPTY_IDS
+        return self.ids[self.offsets[pos]:self.offsets[pos + 1]]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def max_parent(self):
+        return int(self.keys[-1]) if len(self.keys) else -1
+
+    def max_child(self):
+        return int(self.ids.max()) if len(self.ids) else -1
+
+    def matrix(self, shape):
+        """Sparse parent id x child id adjacency (CSR, float32 ones) of the given shape."""
+        parents = np.repeat(self.keys, np.diff(self.offsets))
+        return sparse.csr_matrix((np.ones(len(self.ids), dtype=np.float32), (parents, self.ids)), shape=shape)
+
+
+def _relation_from(df, parent_col):
+    """Build a Relation from an item frame, tolerating the empty frame load_table returns on errors."""
+    if df is None or df.empty or parent_col not in df.columns:
+        return Relation(EMPTY_IDS, EMPTY_IDS)
+    return Relation(df[parent_col].to_numpy(), df["id"].to_numpy())
+
+
+class LinkIndex:
+    """
+    destination -> places and place -> hotels/activities/foods lookups used to
+    propagate favorites. Built once per catalog load in a single pass per relation,
+    so the cost grows linearly with the catalog instead of destinations x items.
+    """
+
+    def __init__(self, places, hotels, activities, foods):
+        self.destination_places = _relation_from(places, "destination_id")
+        self.place_children = {
+            "hotels": _relation_from(hotels, "place_id"),
+            "activities": _relation_from(activities, "place_id"),
+            "foods": _relation_from(foods, "place_id"),
+        }
+
+    def places_of(self, destination_id):
+        """Ids of the places inside a destination."""
+        return self.destination_places.get(destination_id)
+
+    def children_of(self, place_id, kind):
+        """Ids of the hotels, activities or foods (kind) at a place."""
+        return self.place_children[kind].get(place_id)
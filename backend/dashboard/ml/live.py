@@ -0,0 +1,205 @@
+# dashboard/ml/live.py
+
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .als import ALSModel
+from .collaborative import (
+    USER_NEIGHBOURS_MODEL, ItemNeighbours, UserNeighbours, row_neighbours, rows_matrix,
+)
+from .dataLoader import load_interactions_of
+from .model_store import load_model
+from .pipeline import cf_mode, model_version, offline_model, user_item_matrix_from
+from .responses import patch_user_stats
+from .snapshot import mark_stale, on_refresh
+
+NO_KEYS = np.empty(0, dtype=np.int64)
+NO_SCORES = np.empty(0, dtype=np.float32)
+
+
+class UserPatch:
+    """
+    What changed for one user since the base of a LiveScoring was built: their
+    current row (None when the base row still holds) and, by mode, their
+    neighbour list or their ALS factors.
+    """
+
+    __slots__ = ("item_keys", "scores", "neighbours", "vector")
+
+    def __init__(self, item_keys=None, scores=None, neighbours=None, vector=None):
+        self.item_keys = item_keys
+        self.scores = scores
+        self.neighbours = neighbours  # (neighbour user ids, similarities)
+        self.vector = vector          # ALS factors, None when the model knows none of the items
+
+
+class LiveScoring:
+    """
+    Scoring inputs over every user for one catalog snapshot and model version.
+    The base (matrix and similarity) is never modified, request threads read it
+    without a lock. A user's new interaction only adds a UserPatch to patches
+    (under _lock), so a write costs that user's row, and the patches are
+    merged into the base by the next refresh, which builds a new LiveScoring.
+    """
+
+    __slots__ = ("snapshot_version", "model_version", "links", "user_item_matrix", "similarity", "patches")
+
+    def __init__(self, snapshot_version, model_version, links, user_item_matrix, similarity):
+        self.snapshot_version = snapshot_version
+        self.model_version = model_version
+        self.links = links
+        self.user_item_matrix = user_item_matrix
+        self.similarity = similarity  # UserNeighbours, ItemNeighbours, ALSModel or None for 'full'
+        self.patches = {}             # user id -> UserPatch
+
+    def row(self, user_id):
+        """(item keys, scores) of a user's current row, empty without interactions."""
+        patch = self.patches.get(user_id)
+        if patch is not None and patch.item_keys is not None:
+            return patch.item_keys, patch.scores
+        row = self.user_item_matrix.row_of(user_id)
+        return self.user_item_matrix.row_items(row) if row is not None else (NO_KEYS, NO_SCORES)
+
+    def neighbours_k(self):
+        # 'full' scores from every user with a positive similarity
+        if self.similarity is None:
+            return max(self.user_item_matrix.shape[0], 1)
+        return getattr(settings, "ML_CF_NEIGHBOURS", 50)
+
+    def patch(self, user_id, item_keys, scores):
+        """UserPatch of a user whose current row is (item_keys, scores), computed from this base."""
+        if isinstance(self.similarity, ALSModel):
+            return UserPatch(item_keys, scores, vector=self.similarity.solve(item_keys, scores))
+        if isinstance(self.similarity, ItemNeighbours):
+            return UserPatch(item_keys, scores)
+        neighbours = row_neighbours(self.user_item_matrix, item_keys, scores, k=self.neighbours_k(),
+                                    exclude_user=user_id)
+        return UserPatch(item_keys, scores, neighbours=neighbours)
+
+
+# per process, every worker patches only the writes it handled itself and
+# catches up with the others on the next snapshot refresh
+_state = None
+_lock = threading.Lock()
+_written = None  # user id -> (item keys, scores) written while the refresher builds a new state
+
+
+def _is_current(state, snapshot_version, version):
+    return state is not None and state.snapshot_version == snapshot_version and state.model_version == version
+
+
+def _build(snapshot, version):
+    user_item_matrix = user_item_matrix_from(snapshot.user_interactions)
+
+    similarity = offline_model()
+    if similarity is None and cf_mode() != "full":
+        # stored neighbour lists, users missing from them are filled in on their first request
+        similarity = load_model(USER_NEIGHBOURS_MODEL, UserNeighbours.load)
+        if similarity is None:
+            similarity = UserNeighbours([], [0], [], [])
+    # computed here so that requests and writes only pay for single rows
+    if isinstance(similarity, ALSModel):
+        similarity.gram
+    elif not isinstance(similarity, ItemNeighbours):
+        user_item_matrix.normalized_by_item
+    return LiveScoring(snapshot.version, version, snapshot.user_interactions.get("links"), user_item_matrix, similarity)
+
+
+def prepare_live_scoring(snapshot):
+    """
+    Build the live state for snapshot unless the current one already matches it
+    and the stored model. Runs in the snapshot refresher thread, so requests
+    keep reading the previous state meanwhile; writes that land during the
+    build are patched into the new state before it is swapped in.
+    """
+    global _state, _written
+    version = model_version()
+    if _is_current(_state, snapshot.version, version):
+        return
+    with _lock:
+        _written = {}
+    try:
+        state = _build(snapshot, version)
+    finally:
+        with _lock:
+            written, _written = _written, None
+    with _lock:
+        for user_id, (item_keys, scores) in written.items():
+            state.patches[user_id] = state.patch(user_id, item_keys, scores)
+        _state = state
+
+
+on_refresh(prepare_live_scoring)
+
+
+def live_scoring_inputs(snapshot, user_id):
+    """
+    (user_item_matrix, similarity) for a request served from the catalog
+    snapshot, covering just what scoring this user reads: their row and, for
+    user based modes, the rows of their neighbours, patches applied.
+    """
+    global _state
+    state = _state
+    if state is None:
+        # only the first request of a process builds, later ones are the refresher's job
+        with _lock:
+            if _state is None:
+                _state = _build(snapshot, model_version())
+            state = _state
+    elif not _is_current(state, snapshot.version, model_version()):
+        # serve the previous state until the refresher has built the new one
+        mark_stale()
+
+    item_keys, scores = state.row(user_id)
+    similarity = state.similarity
+    patch = state.patches.get(user_id)
+    if isinstance(similarity, (ALSModel, ItemNeighbours)):
+        if isinstance(similarity, ALSModel) and patch is not None:
+            similarity = similarity.with_user_vector(user_id, patch.vector)
+        return rows_matrix([user_id], [(item_keys, scores)]), similarity
+
+    if patch is not None and patch.neighbours is not None:
+        neighbour_ids, sims = patch.neighbours
+    elif similarity is not None and user_id in similarity.user_index:
+        neighbour_ids, sims = similarity.neighbours_of(user_id)
+    else:
+        # joined after the neighbour build (or 'full' mode): computed once, kept until the next refresh
+        neighbour_ids, sims = row_neighbours(state.user_item_matrix, item_keys, scores, k=state.neighbours_k(),
+                                             exclude_user=user_id)
+        with _lock:
+            state.patches.setdefault(user_id, UserPatch(neighbours=(neighbour_ids, sims)))
+
+    user_ids = [user_id, *neighbour_ids.tolist()]
+    user_item_matrix = rows_matrix(user_ids, [(item_keys, scores)] + [state.row(other) for other in user_ids[1:]])
+    return user_item_matrix, UserNeighbours([user_id], [0, len(neighbour_ids)], neighbour_ids, sims)
+
+
+def update_user(user_id):
+    """
+    Re-read one user's favorites, ratings and comments and patch them into the
+    live state: their row and their neighbour list ('neighbours' and 'full'
+    modes) or their ALS factors ('als' mode), and into the item stats of the
+    responses. Called from the model signals after a write.
+    """
+    frames = load_interactions_of(user_id)
+    if any(df.columns.empty for df in frames.values()):
+        # a read failed, keep the current row rather than wiping it
+        return
+    patch_user_stats(user_id, frames)
+    state = _state
+    if state is None:
+        return
+
+    own = user_item_matrix_from({**frames, "links": state.links})
+    item_keys, scores = own.row_items(0) if own.shape[0] else (NO_KEYS, NO_SCORES)
+    patch = state.patch(user_id, item_keys, scores)
+    with _lock:
+        # the rows were just read from the db, so patching whatever state is current is right
+        current = _state
+        if current is not state:
+            patch = current.patch(user_id, item_keys, scores)
+        current.patches[user_id] = patch
+        if _written is not None:
+            _written[user_id] = (item_keys, scores)
@@ -0,0 +1,148 @@
+# dashboard/ml/mmap_snapshot.py
+
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from .dataLoader import (
+    CATALOG_TABLES, INTERACTION_TABLES, ITEM_TYPE_DTYPE,
+    load_table, load_table_since, read_snapshot,
+)
+from .item_keys import ITEM_TYPES
+
+# ------------------------ LAYOUT ------------------------
+# <directory>/CURRENT              name of the dump workers should map
+# <directory>/<dump>/manifest.json tables, columns and item type vocabulary
+# <directory>/<dump>/<table>.<column>.npy
+#
+# only numeric columns are written (ids, foreign keys, ratings, prices and the
+# interaction triples), so every column can be memory mapped read-only and the
+# pages are shared by all workers on the host.
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+KEEP_DUMPS = 2  # older dumps are removed, the previous one stays for workers still mapping it
+
+
+def _column_array(series):
+    """Numeric array stored for a column, None for columns we do not dump."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(dtype=np.int8)
+    if isinstance(series.dtype, pd.DatetimeTZDtype):
+        # microseconds since the epoch, enough to restore the sync watermark
+        return series.dt.tz_convert("UTC").astype("datetime64[us, UTC]").astype("int64").to_numpy()
+    if series.dtype.kind in "iuf":
+        return series.to_numpy()
+    return None
+
+
+def write_snapshot(directory):
+    """
+    Dump the catalog and the interactions (read in one DB snapshot) as .npy columns
+    and point CURRENT at the new dump. Returns the dump name.
+    """
+    with read_snapshot():
+        frames = {table_name: load_table(table_name) for table_name in CATALOG_TABLES}
+        for table_name in INTERACTION_TABLES.values():
+            df = load_table_since(table_name, None)
+            frames[table_name] = df if df is not None else pd.DataFrame()
+
+    # the timestamp keeps dumps sorted, the pid and random suffix keep two dumps of the same
+    # second apart; an existing directory is never written into, workers may have it mapped
+    name = f"{time.strftime('dump-%Y%m%d-%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    target = os.path.join(directory, name)
+    os.makedirs(directory, exist_ok=True)
+    os.mkdir(target)
+
+    manifest = {"name": name, "created": time.time(), "item_types": list(ITEM_TYPES), "tables": {}}
+    for table_name, df in frames.items():
+        columns = {}
+        for column in df.columns:
+            values = _column_array(df[column])
+            if values is None:
+                continue
+            np.save(os.path.join(target, f"{table_name}.{column}.npy"), values)
+            columns[column] = str(df[column].dtype)
+        manifest["tables"][table_name] = {"rows": len(df), "columns": columns}
+
+    with open(os.path.join(target, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # swapping CURRENT is atomic, workers see either the old or the new dump
+    tmp = os.path.join(directory, CURRENT_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(name)
+    os.replace(tmp, os.path.join(directory, CURRENT_FILE))
+
+    _prune(directory)
+    return name
+
+
+def _prune(directory):
+    # oldest first by creation time, names of the same second do not sort by it
+    current = current_dump(directory)
+    dumps = sorted((d for d in os.listdir(directory) if d.startswith("dump-")),
+                   key=lambda d: os.stat(os.path.join(directory, d)).st_mtime_ns)
+    for old in dumps[:-KEEP_DUMPS]:
+        if old != current:
+            shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+
+def current_dump(directory):
+    """Name of the dump CURRENT points at, None if nothing was written yet."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class MappedSnapshot:
+    """
+    Read-only view of one dump. Columns are np.load(mmap_mode="r") arrays, the
+    frames are built on top of them without copying the numeric data.
+    """
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        with open(os.path.join(self.path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+
+    def column(self, table_name, column):
+        return np.load(os.path.join(self.path, f"{table_name}.{column}.npy"), mmap_mode="r")
+
+    def frame(self, table_name):
+        spec = self.manifest["tables"].get(table_name)
+        if spec is None:
+            return pd.DataFrame()
+        data = {}
+        for column, dtype in spec["columns"].items():
+            values = self.column(table_name, column)
+            if dtype == "category":
+                data[column] = pd.Categorical.from_codes(values, dtype=ITEM_TYPE_DTYPE)
+            elif dtype.startswith("datetime64"):
+                data[column] = pd.to_datetime(values, unit="us", utc=True)
+            else:
+                # wrapping each column in its own Series keeps pandas from
+                # consolidating same-dtype columns into a fresh (private) block
+                data[column] = pd.Series(values, copy=False)
+        return pd.DataFrame(data, copy=False)
+
+    def catalog_frames(self):
+        return {table_name: self.frame(table_name) for table_name in CATALOG_TABLES}
+
+    def interaction_frames(self):
+        return {table_name: self.frame(table_name) for table_name in INTERACTION_TABLES.values()}
+
+
+def open_snapshot(directory):
+    """MappedSnapshot of the current dump in directory, None if there is none."""
+    name = current_dump(directory)
+    if name is None:
+        return None
+    return MappedSnapshot(directory, name)
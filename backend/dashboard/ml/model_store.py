@@ -0,0 +1,90 @@
+# dashboard/ml/model_store.py
+
+import logging
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# ------------------------ SETTINGS ------------------------
+MODEL_DIR = getattr(settings, "ML_MODEL_DIR", None)  # where the offline build commands write their models
+
+# name -> (path, mtime, model), every worker keeps its own copy
+_loaded = {}
+_lock = threading.Lock()
+
+
+def model_path(name, directory=None):
+    """File a model is stored in, None when no model directory is configured."""
+    directory = directory or MODEL_DIR
+    if not directory:
+        return None
+    return os.path.join(directory, name)
+
+
+def model_mtime(name, directory=None):
+    """Modification time of a stored model, None if it was never built."""
+    path = model_path(name, directory)
+    if path is None:
+        return None
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def save_model(name, save, directory=None):
+    """
+    Write a model through save(path) and move it into place in one step, so
+    workers never read a half written file. Returns the final path.
+    """
+    path = model_path(name, directory)
+    if path is None:
+        raise ValueError("No model directory, set ML_MODEL_DIR")
+    directory, filename = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    root, ext = os.path.splitext(filename)
+    # unique per writer so concurrent builds never share a temp file; same directory
+    # for an atomic os.replace, same extension or np.savez appends .npz
+    fd, tmp = tempfile.mkstemp(prefix=f".{root}.", suffix=ext, dir=directory)
+    os.close(fd)
+    try:
+        save(tmp)
+        os.chmod(tmp, 0o644)  # mkstemp creates it private, workers may run as another user
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path
+
+
+def load_model(name, load, directory=None):
+    """
+    Model stored under name, read with load(path) the first time and again only
+    after the file changed on disk. None if it was never built.
+    """
+    path = model_path(name, directory)
+    if path is None:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+    cached = _loaded.get(name)
+    if cached is not None and cached[0] == path and cached[1] == mtime:
+        return cached[2]
+    with _lock:
+        cached = _loaded.get(name)
+        if cached is not None and cached[0] == path and cached[1] == mtime:
+            return cached[2]
+        try:
+            model = load(path)
+        except Exception:
+            logger.exception("Error loading model %s", name)
+            return None
+        _loaded[name] = (path, mtime, model)
+        return model
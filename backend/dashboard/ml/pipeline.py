@@ -0,0 +1,183 @@
+# dashboard/ml/pipeline.py
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .als import ALS_MODEL, ALSModel
+from .ann import ANN_INDEX, IVFIndex
+from .collaborative import (
+    USER_NEIGHBOURS_MODEL, ITEM_NEIGHBOURS_MODEL, UserNeighbours, ItemNeighbours, build_interactions,
+    create_user_item_matrix, calculate_user_similarity, calculate_user_neighbours, get_recommendations,
+)
+from .item_keys import key_item_ids
+from .model_store import load_model, model_mtime
+
+# item_type query value -> (interaction item type, features clustered for the badges)
+ITEM_TYPE_CONFIG = {
+    "places": ("place", ["avg_rating"]),
+    "hotels": ("hotel", ["avg_rating", "price_range"]),
+    "foods": ("food", ["avg_rating", "price_range"]),
+    "activities": ("activity", ["avg_rating", "price_range"]),
+}
+
+# offline models per ML_CF_MODE: model store name and loader
+OFFLINE_MODELS = {
+    "neighbours": (USER_NEIGHBOURS_MODEL, UserNeighbours.load),
+    "items": (ITEM_NEIGHBOURS_MODEL, ItemNeighbours.load),
+    "als": (ALS_MODEL, ALSModel.load),
+}
+
+
+def cf_mode():
+    return getattr(settings, "ML_CF_MODE", "neighbours")
+
+
+def destination_items(places_df, hotels_df, foods_df, activities_df, destination_id, item_type):
+    """Catalog rows of one item type inside a destination, None for an unknown item_type."""
+    if item_type == "places":
+        return places_df[places_df["destination_id"] == destination_id]
+    frames = {"hotels": hotels_df, "foods": foods_df, "activities": activities_df}
+    df = frames.get(item_type)
+    if df is None:
+        return None
+    return df[df["place_id"].isin(places_df[places_df["destination_id"] == destination_id]["id"])]
+
+
+def offline_model():
+    """Model scored from a user's own history ('items' and 'als' modes), None when not built yet."""
+    mode = cf_mode()
+    if mode not in ("items", "als"):
+        return None
+    name, load = OFFLINE_MODELS[mode]
+    return load_model(name, load)
+
+
+def model_version():
+    """
+    Identifies what recommendations are computed with: the CF mode and the
+    modification time of its stored model ("online" when scoring without one).
+    """
+    mode = cf_mode()
+    name = OFFLINE_MODELS.get(mode, (None,))[0]
+    mtime = model_mtime(name) if name else None
+    return f"{mode}:{mtime if mtime is not None else 'online'}"
+
+
+def user_similarity_for(user_id, user_item_matrix):
+    """
+    Similarity input for get_recommendations. In the default 'neighbours' mode the
+    top-k neighbours built by `manage.py build_user_neighbours` are used, users
+    that joined after the last build get their row computed on the spot.
+    """
+    if cf_mode() == "full":
+        return calculate_user_similarity(user_item_matrix)
+
+    neighbours = load_model(USER_NEIGHBOURS_MODEL, UserNeighbours.load)
+    if neighbours is None or user_id not in neighbours.user_index:
+        neighbours = calculate_user_neighbours(
+            user_item_matrix, k=getattr(settings, "ML_CF_NEIGHBOURS", 50), user_ids=[user_id])
+    return neighbours
+
+
+def user_item_matrix_from(user_interactions):
+    """UserItemMatrix of a user_interactions dict (favorites, ratings, comments and links frames)."""
+    interactions_df = build_interactions(
+        user_interactions.get("favorites", []), user_interactions.get("ratings", []),
+        user_interactions.get("comments", []), user_interactions.get("links"))
+    return create_user_item_matrix(interactions_df)
+
+
+def _rows_of(interactions, user_id):
+    """One user's rows of an interaction frame (or list of dicts)."""
+    df = interactions if isinstance(interactions, pd.DataFrame) else pd.DataFrame(interactions)
+    if df.empty:
+        return df
+    return df[df["user_id"].to_numpy() == user_id]
+
+
+def scoring_inputs(user_interactions, user_id=None):
+    """
+    (user_item_matrix, similarity) to score with. With user_id the inputs are
+    prepared for that one user: offline models only get the user's own history.
+    Without it they cover every user, for batch scoring.
+    """
+    # models built offline, scoring with them only needs this user's own history
+    model = offline_model()
+    if model is not None and user_id is not None:
+        user_interactions = {
+            **user_interactions,
+            **{key: _rows_of(user_interactions.get(key, []), user_id) for key in ("favorites", "ratings", "comments")},
+        }
+
+    user_item_matrix = user_item_matrix_from(user_interactions)
+    if model is not None:
+        return user_item_matrix, model
+    if user_id is not None:
+        return user_item_matrix, user_similarity_for(user_id, user_item_matrix)
+
+    # every user at once: stored neighbours if they exist, else computed blockwise
+    if cf_mode() == "full":
+        return user_item_matrix, calculate_user_similarity(user_item_matrix)
+    k = getattr(settings, "ML_CF_NEIGHBOURS", 50)
+    neighbours = load_model(USER_NEIGHBOURS_MODEL, UserNeighbours.load)
+    if neighbours is None:
+        neighbours = calculate_user_neighbours(user_item_matrix, k=k)
+    else:
+        # users that joined after the last build, computed like user_similarity_for does per request
+        missing = [user_id for user_id in user_item_matrix.user_ids.tolist() if user_id not in neighbours.user_index]
+        if missing:
+            neighbours = neighbours.extended(calculate_user_neighbours(user_item_matrix, k=k, user_ids=missing))
+    return user_item_matrix, neighbours
+
+
+def ann_recommendations(user_id, user_item_matrix, model, destination_id, category, candidate_ids=None, top_n=10,
+                        return_scores=False):
+    """
+    Item ids (and scores with return_scores) from the IVF index of
+    `manage.py build_ann_index` when the ALS model is in use and the index was
+    built from this very fit, None otherwise. Like exact scoring only items in
+    candidate_ids scoring above 0 count, None as well when fewer than top_n
+    of them are left so that the caller scores exactly instead.
+    """
+    if not isinstance(model, ALSModel):
+        return None
+    index = load_model(ANN_INDEX, IVFIndex.load)
+    seen_keys, seen_scores = user_item_matrix.row_items(user_item_matrix.row_of(user_id))
+    vector = model.vector_for(user_id, seen_keys, seen_scores)
+    if index is None or index.source_version != model.version or vector is None:
+        return None
+    keys, scores = index.search(vector, destination_id, category, top_n=top_n,
+                                nprobe=getattr(settings, "ML_ANN_NPROBE", 4), exclude_keys=seen_keys)
+    ids = key_item_ids(keys)
+    keep = scores > 0
+    if candidate_ids is not None:
+        keep &= np.isin(ids, np.asarray(candidate_ids, dtype=np.int64))
+    if keep.sum() < top_n:
+        return None
+    ids, scores = ids[keep].tolist(), scores[keep].tolist()
+    return (ids, scores) if return_scores else ids
+
+
+def recommend_ids(user_id, destination_id, category, candidate_ids, user_item_matrix, similarity, top_n=10,
+                  return_scores=False):
+    """
+    CF recommended item ids, best first, None if the user has no interactions
+    to go on or none of the candidates could be ranked. With return_scores it
+    is (ids, scores).
+    """
+    if not user_item_matrix.has_interactions(user_id):
+        return None
+    if isinstance(similarity, ALSModel) and similarity.vector_for(
+            user_id, *user_item_matrix.row_items(user_item_matrix.row_of(user_id))) is None:
+        # none of the user's items were in the fit, nothing to rank from
+        return None
+    ids = ann_recommendations(user_id, user_item_matrix, similarity, destination_id, category, candidate_ids,
+                              top_n=top_n, return_scores=return_scores)
+    if ids is None:
+        ids = get_recommendations(user_id, user_item_matrix, similarity, top_n=top_n, category=category,
+                                  candidate_ids=candidate_ids, return_scores=return_scores)
+    # nothing left to rank (e.g. every item of the destination already seen), same as no history
+    if not (ids[0] if return_scores else ids):
+        return None
+    return ids
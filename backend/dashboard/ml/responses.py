@@ -0,0 +1,196 @@
+# dashboard/ml/responses.py
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+# serializer fields filled from the interaction frames instead of per-row queries
+STAT_FIELDS = ("average_rating", "favorites_count", "comments_count")
+
+# serializer field -> catalog frame column where the names differ
+FRAME_COLUMNS = {"destination": "destination_id", "place": "place_id"}
+
+# sums behind STAT_FIELDS, kept apart so that a user's rows can be swapped for their current ones
+SUM_COLUMNS = ["rating_sum", "rating_count", "favorites_count", "comments_count"]
+ITEM_KEYS = ["item_type", "item_id"]
+USER_ITEM_KEYS = ["user_id", "item_type", "item_id"]
+INTERACTION_KEYS = ("favorites", "ratings", "comments")
+
+# a write is applied on top of the snapshot's interactions until it holds them, entries
+# are dropped after this long (the snapshot refreshes at least every ML_SNAPSHOT_TTL)
+WRITTEN_TTL = 2 * getattr(settings, "ML_SNAPSHOT_TTL", 300)
+
+# sums of the last interactions seen (they only change with the snapshot) and what the
+# users written since change in them, per (user_id, item_type, item_id) and per item
+_stats = {"source": None, "by_type": {}, "written_rows": None, "written": {}}
+_written = {}  # user id -> (time.time() of the read, their frames as load_interactions_of returns them)
+_stats_lock = threading.Lock()
+
+
+def _frame(rows):
+    return rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+
+
+def _sums(frames, keys):
+    """DataFrame of SUM_COLUMNS indexed by keys, for every group with an interaction."""
+    ratings, favorites, comments = (_frame(frames.get(key, [])) for key in ("ratings", "favorites", "comments"))
+
+    parts = []
+    if not ratings.empty:
+        rating = ratings.astype({"rating": "float64"}).groupby(keys, observed=True)["rating"]
+        parts += [rating.sum().rename("rating_sum"), rating.size().rename("rating_count")]
+    for name, df in (("favorites_count", favorites), ("comments_count", comments)):
+        if not df.empty:
+            parts.append(df.groupby(keys, observed=True).size().rename(name))
+    if not parts:
+        return pd.DataFrame(columns=SUM_COLUMNS, index=pd.MultiIndex.from_tuples([], names=keys), dtype=np.float64)
+    return pd.concat(parts, axis=1).reindex(columns=SUM_COLUMNS).fillna(0).astype(np.float64)
+
+
+def _by_type(sums):
+    """item_type -> the rows of sums (indexed by (item_type, item_id)) of that type, indexed by item id."""
+    return {str(item_type): frame.droplevel(0) for item_type, frame in sums.groupby(level=0, observed=True)}
+
+
+def _written_rows(user_interactions, written):
+    """
+    What the current rows of the written users (user id -> (read time, frames))
+    change in the sums of user_interactions, indexed by USER_ITEM_KEYS.
+    Zero for users whose rows user_interactions already holds.
+    """
+    user_ids = list(written)
+    held, current = {}, {}
+    for key in INTERACTION_KEYS:
+        df = _frame(user_interactions.get(key, []))
+        held[key] = df[df["user_id"].isin(user_ids)] if not df.empty else df
+        current[key] = pd.concat([frames[key] for _, frames in written.values()], ignore_index=True)
+    return _sums(current, USER_ITEM_KEYS).sub(_sums(held, USER_ITEM_KEYS), fill_value=0)
+
+
+def _set_written_rows(rows):
+    _stats["written_rows"] = rows
+    _stats["written"] = _by_type(rows.groupby(level=ITEM_KEYS, observed=True).sum()) if not rows.empty else {}
+
+
+def _switch_source(user_interactions):
+    now = time.time()
+    for user_id in [user_id for user_id, (read_at, _) in _written.items() if now - read_at > WRITTEN_TTL]:
+        del _written[user_id]
+    _stats["by_type"] = _by_type(_sums(user_interactions, ITEM_KEYS))
+    _set_written_rows(_written_rows(user_interactions, _written) if _written else _sums({}, USER_ITEM_KEYS))
+    _stats["source"] = user_interactions
+
+
+def interaction_stats(user_interactions, category, ids):
+    """
+    DataFrame of STAT_FIELDS (average rating, favorites and comments) indexed
+    by ids, items of one item type (category as in the interaction frames, e.g.
+    "hotel"). The sums over user_interactions are computed once per dict, i.e.
+    once per snapshot, the writes patch_user_stats recorded are added on top.
+    """
+    with _stats_lock:
+        if _stats["source"] is not user_interactions:
+            _switch_source(user_interactions)
+        parts = [_stats["by_type"].get(category), _stats["written"].get(category)]
+
+    sums = np.zeros((len(ids), len(SUM_COLUMNS)))
+    for part in parts:
+        if part is not None:
+            sums += part.reindex(ids, fill_value=0).to_numpy()
+    rating_sum, rating_count, favorites_count, comments_count = sums.T
+    average = np.divide(rating_sum, rating_count, out=np.zeros(len(ids)), where=rating_count > 0)
+    return pd.DataFrame({
+        "average_rating": np.round(average, 1),
+        "favorites_count": favorites_count.round().astype(np.int64),
+        "comments_count": comments_count.round().astype(np.int64),
+    }, index=ids)
+
+
+def patch_user_stats(user_id, frames):
+    """
+    Have the stats count a user's current favorites, ratings and comments
+    (frames as load_interactions_of returns them, read after a write) instead
+    of the snapshot's until a snapshot holds them. Called from live.update_user.
+    """
+    read_at = time.time()
+    source = _stats["source"]
+    rows = _written_rows(source, {user_id: (read_at, frames)}) if source is not None else None
+    with _stats_lock:
+        _written[user_id] = (read_at, frames)
+        if _stats["source"] is None:
+            return
+        if _stats["source"] is not source:
+            # a new snapshot came in meanwhile, rare enough to redo it under the lock
+            rows = _written_rows(_stats["source"], {user_id: (read_at, frames)})
+        others = _stats["written_rows"]
+        others = others[others.index.get_level_values("user_id") != user_id]
+        _set_written_rows(pd.concat([others, rows]) if not others.empty else rows)
+
+
+def in_order(df, ids):
+    """Rows of df with the given ids, in that order (ids missing from df are dropped)."""
+    positions = pd.Index(df["id"]).get_indexer(ids)
+    return df.iloc[positions[positions >= 0]]
+
+
+def _image_url(name):
+    # what ImageField serializes to without a request: the storage url, None if empty
+    return default_storage.url(name) if isinstance(name, str) and name else None
+
+
+def _display_columns(fields):
+    """serializer field -> frame column for the fields read from the catalog frames."""
+    return {field: FRAME_COLUMNS.get(field, field) for field in dict.fromkeys(fields) if field not in STAT_FIELDS}
+
+
+def with_display_columns(model, df, fields):
+    """
+    df with the displayed columns it lacks (e.g. snapshots mapped from a numeric
+    dump) read from model in one query, rows no longer in the database dropped.
+    """
+    missing = [column for column in _display_columns(fields).values() if column not in df.columns]
+    if not missing or df.empty:
+        return df.assign(**{column: pd.Series(dtype=object) for column in missing})
+    rows = model.objects.filter(id__in=df["id"].tolist()).values_list("id", *missing)
+    display = pd.DataFrame.from_records(list(rows), columns=["id", *missing]).set_index("id")
+    df = df[df["id"].isin(display.index)]
+    return df.assign(**{column: display[column].reindex(df["id"]).to_numpy() for column in missing})
+
+
+def build_items(df, fields, category, user_interactions, scores=None):
+    """
+    Response items for the rows of df, in their order, with the serializer's
+    fields plus cluster_badge and score (scores maps item id -> CF score, None
+    for items that were not CF ranked). Built from the catalog and interaction
+    frames, so no query per item, the stats include this worker's writes (see
+    interaction_stats). A response in the result cache keeps the stats it was
+    built with until the snapshot changes. Returns None when df lacks a
+    displayed column, see with_display_columns.
+    """
+    fields = list(dict.fromkeys(fields))
+    columns = _display_columns(fields)
+    if any(column not in df.columns for column in columns.values()):
+        return None
+
+    ids = df["id"].to_numpy()
+    stats = interaction_stats(user_interactions, category, ids)
+    values = {}
+    for field in fields:
+        if field in STAT_FIELDS:
+            values[field] = stats[field].tolist()
+        elif field == "image":
+            values[field] = [_image_url(name) for name in df["image"].tolist()]
+        elif field == "price_range":
+            # held as float32, its shortest decimal is the price as it was entered
+            values[field] = [float(str(price)) for price in df["price_range"].to_numpy(dtype=np.float32)]
+        else:
+            values[field] = df[columns[field]].tolist()
+
+    values["cluster_badge"] = df["cluster_badge"].tolist() if "cluster_badge" in df.columns else [None] * len(ids)
+    values["score"] = [(scores or {}).get(item_id) for item_id in ids.tolist()]
+    names = list(values)
+    return [dict(zip(names, row)) for row in zip(*values.values())]
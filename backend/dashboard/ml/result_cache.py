@@ -0,0 +1,104 @@
+# dashboard/ml/result_cache.py
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+# ------------------------ SETTINGS ------------------------
+# alias of the Django cache holding recommend_view responses; its TIMEOUT and
+# MAX_ENTRIES (or the backend's own eviction) bound how long and how many are kept
+CACHE_ALIAS = getattr(settings, "ML_RESULT_CACHE", "recommendations")
+# alias of the cache holding the generation tokens, shared by all workers so a
+# write handled by one of them invalidates the responses cached by the others
+GENERATION_CACHE_ALIAS = getattr(settings, "ML_GENERATION_CACHE", "ml-generations")
+
+CATALOG_GENERATION_KEY = "ml:rec:gen:catalog"
+
+logger = logging.getLogger(__name__)
+
+
+def _cache():
+    return caches[CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else "default"]
+
+
+def _generations():
+    return caches[GENERATION_CACHE_ALIAS] if GENERATION_CACHE_ALIAS in settings.CACHES else _cache()
+
+
+def _generation_key(user_id):
+    return f"ml:rec:gen:{user_id}"
+
+
+def _read_generations(keys):
+    """
+    Current token of every generation key in one round trip, creating missing
+    ones. A token evicted from the cache is replaced by a fresh one, so old
+    entries can never become reachable again. None when the cache fails.
+    """
+    try:
+        cache = _generations()
+        tokens = cache.get_many(keys)
+        for key in keys:
+            if key not in tokens:
+                tokens[key] = cache.get_or_set(key, time.time_ns, timeout=None)
+        return tokens
+    except Exception:
+        logger.exception("Error reading recommendation cache generations")
+        return None
+
+
+def result_keys(user_id, destination_id, item_types, model_version, catalog_version=None):
+    """
+    item_type -> cache key of its response. A key changes with the model, the
+    catalog (catalog_version, or the shared catalog generation when None) and
+    the user's favorites, ratings and comments. Empty when the generations
+    cannot be read, the responses are then computed without caching.
+    """
+    user_key = _generation_key(user_id)
+    tokens = _read_generations([user_key] if catalog_version is not None else [user_key, CATALOG_GENERATION_KEY])
+    if tokens is None:
+        return {}
+    if catalog_version is None:
+        catalog_version = f"db:{tokens[CATALOG_GENERATION_KEY]}"
+    return {
+        item_type: f"ml:rec:{user_id}:{destination_id}:{item_type}:{model_version}:{catalog_version}:{tokens[user_key]}"
+        for item_type in item_types
+    }
+
+
+def get_results(keys):
+    """item_type -> cached response for the keys of result_keys that are cached."""
+    if not keys:
+        return {}
+    try:
+        found = _cache().get_many(list(keys.values()))
+    except Exception:
+        logger.exception("Error reading cached recommendations")
+        return {}
+    return {item_type: found[key] for item_type, key in keys.items() if key in found}
+
+
+def set_result(key, data):
+    try:
+        _cache().set(key, data)
+    except Exception:
+        logger.exception("Error caching recommendations")
+
+
+def _bump(key):
+    try:
+        _generations().set(key, time.time_ns(), timeout=None)
+    except Exception:
+        logger.exception("Error invalidating cached recommendations (%s)", key)
+
+
+def invalidate_user(user_id):
+    """Make every cached response of a user unreachable, they age out of the cache on their own."""
+    _bump(_generation_key(user_id))
+
+
+def invalidate_catalog():
+    """Make every response computed from the database catalog unreachable (see result_keys)."""
+    _bump(CATALOG_GENERATION_KEY)
@@ -0,0 +1,211 @@
+# dashboard/ml/snapshot.py
+
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .dataLoader import load_all_data, merge_destination_types, seed_interaction_state, synced_interactions
+from .links import LinkIndex
+from .mmap_snapshot import open_snapshot
+
+logger = logging.getLogger(__name__)
+
+# ------------------------ SETTINGS ------------------------
+SNAPSHOT_TTL = getattr(settings, "ML_SNAPSHOT_TTL", 300)  # seconds before a snapshot is rebuilt anyway
+SNAPSHOT_MIN_INTERVAL = getattr(settings, "ML_SNAPSHOT_MIN_INTERVAL", 2)  # coalesces bursts of model changes
+SNAPSHOT_DIR = getattr(settings, "ML_SNAPSHOT_DIR", None)  # on-disk dump to map instead of querying the catalog
+
+
+class CatalogSnapshot:
+    """
+    One consistent load of the catalog and the user interactions.
+    Snapshots are never modified after they are built, a refresh builds a new one
+    with a higher version and swaps it in, so request threads can read the current
+    one without taking a lock. Treat the frames as read-only.
+    """
+
+    __slots__ = (
+        "version", "source", "built_at", "destinations", "destination_types",
+        "places", "activities", "foods", "hotels", "user_interactions",
+    )
+
+    def __init__(self, version, destinations, destination_types, places, activities, foods, hotels, user_interactions,
+                 source="db"):
+        self.version = version
+        self.source = source  # "db" or the name of the mapped on-disk dump
+        self.built_at = time.time()
+        self.destinations = destinations
+        self.destination_types = destination_types
+        self.places = places
+        self.activities = activities
+        self.foods = foods
+        self.hotels = hotels
+        self.user_interactions = user_interactions
+
+    @property
+    def age(self):
+        return time.time() - self.built_at
+
+    @property
+    def cache_version(self):
+        """
+        Identifies this snapshot in a cache shared between workers: version is a
+        per-process counter, so two workers may hold different data under the same one.
+        """
+        return f"{os.getpid()}-{self.built_at:.6f}-{self.version}"
+
+    def as_tuple(self):
+        """Same tuple load_all_data returns."""
+        return (self.destinations, self.destination_types, self.places, self.activities,
+                self.foods, self.hotels, self.user_interactions)
+
+
+# ------------------------ PROCESS WIDE STATE ------------------------
+_current = None               # the snapshot request threads read, replaced as a whole
+_build_lock = threading.Lock()  # only one build at a time, readers never take it
+_stale = threading.Event()    # set by model signals to ask for an early rebuild
+_refresh_callbacks = []       # registered with on_refresh, run after each refresh
+_refresher = None
+_refresher_pid = None
+_refresher_lock = threading.Lock()
+
+
+def build_snapshot(version, previous=None):
+    """Load everything once and wrap it into a CatalogSnapshot."""
+    if SNAPSHOT_DIR:
+        mapped = open_snapshot(SNAPSHOT_DIR)
+        if mapped is not None:
+            return _build_from_dump(version, mapped, previous)
+
+    destinations, destination_types, places, activities, foods, hotels, user_interactions = load_all_data()
+    return CatalogSnapshot(version, destinations, destination_types, places, activities, foods, hotels, user_interactions)
+
+
+def _build_from_dump(version, mapped, previous):
+    """
+    Snapshot over the memory-mapped dump written by `manage.py dump_ml_snapshot`.
+    A worker's first build never touches the database, later builds keep the mapped
+    catalog until a newer dump appears and only sync new interaction rows on top of it.
+    """
+    if previous is not None and previous.source == mapped.name:
+        user_interactions = {**previous.user_interactions, **synced_interactions()}
+        return CatalogSnapshot(version, previous.destinations, previous.destination_types, previous.places,
+                               previous.activities, previous.foods, previous.hotels, user_interactions,
+                               source=mapped.name)
+
+    catalog = mapped.catalog_frames()
+    seed_interaction_state(mapped.interaction_frames())
+    places, hotels = catalog["dashboard_place"], catalog["dashboard_hotel"]
+    activities, foods = catalog["dashboard_activity"], catalog["dashboard_food"]
+    user_interactions = {
+        **synced_interactions(sync=previous is not None),
+        "links": LinkIndex(places, hotels, activities, foods),
+    }
+    destination_types = catalog["accounts_destinationtype"]
+    destinations = merge_destination_types(catalog["accounts_destination"], destination_types)
+    return CatalogSnapshot(version, destinations, destination_types, places, activities, foods, hotels,
+                           user_interactions, source=mapped.name)
+
+
+CATALOG_FRAMES = ("destinations", "destination_types", "places", "activities", "foods", "hotels")
+
+
+def _same_data(previous, snapshot):
+    """
+    True when a rebuild loaded exactly what previous holds. The loader hands out
+    the same interaction frames while no row changed, the catalog is compared.
+    """
+    if previous.source != snapshot.source:
+        return False
+    if any(previous.user_interactions.get(key) is not frame
+           for key, frame in snapshot.user_interactions.items() if key != "links"):
+        return False
+    return all(getattr(previous, name) is getattr(snapshot, name) or getattr(previous, name).equals(getattr(snapshot, name))
+               for name in CATALOG_FRAMES)
+
+
+def refresh_snapshot(only_if_missing=False):
+    """
+    Build a new snapshot and make it the current one, returns it. When nothing
+    changed the current snapshot (and its version, which result cache keys and
+    the live scoring state follow) is kept.
+    """
+    global _current
+    with _build_lock:
+        if only_if_missing and _current is not None:
+            return _current
+        version = _current.version + 1 if _current is not None else 1
+        snapshot = build_snapshot(version, previous=_current)
+        if _current is None or not _same_data(_current, snapshot):
+            _current = snapshot
+        return _current
+
+
+def get_snapshot():
+    """
+    Current snapshot for this process.
+    Only the very first call waits for the database, afterwards the background
+    refresher keeps it fresh and this is a plain attribute read.
+    """
+    _ensure_refresher()
+    snapshot = _current
+    if snapshot is None:
+        snapshot = refresh_snapshot(only_if_missing=True)
+    return snapshot
+
+
+def current_snapshot():
+    """Snapshot currently served, None before the first build (never triggers one)."""
+    return _current
+
+
+def mark_stale():
+    """Ask the refresher to rebuild soon, called when catalog or interaction models change."""
+    _stale.set()
+
+
+def on_refresh(callback):
+    """
+    Run callback(snapshot) in the refresher thread after every refresh, for state
+    derived from the snapshot (the live scoring inputs) that requests should not
+    have to build.
+    """
+    _refresh_callbacks.append(callback)
+
+
+# ------------------------ BACKGROUND REFRESH ------------------------
+def _refresh_loop():
+    while True:
+        # wakes up on a model change or when the TTL runs out
+        _stale.wait(timeout=SNAPSHOT_TTL)
+        _stale.clear()
+        close_old_connections()
+        try:
+            snapshot = refresh_snapshot()
+        except Exception:
+            # keep serving the previous snapshot
+            logger.exception("Error refreshing catalog snapshot")
+        else:
+            for callback in _refresh_callbacks:
+                try:
+                    callback(snapshot)
+                except Exception:
+                    logger.exception("Error preparing state for catalog snapshot %s", snapshot.version)
+        time.sleep(SNAPSHOT_MIN_INTERVAL)
+
+
+def _ensure_refresher():
+    """Start the refresher thread once per process (again after a fork)."""
+    global _refresher, _refresher_pid
+    if _refresher is not None and _refresher_pid == os.getpid():
+        return
+    with _refresher_lock:
+        if _refresher is not None and _refresher_pid == os.getpid():
+            return
+        _refresher = threading.Thread(target=_refresh_loop, name="ml-snapshot-refresher", daemon=True)
+        _refresher_pid = os.getpid()
+        _refresher.start()
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from accounts.models import Destination
@@ -148,8 +149,30 @@ class Rating(models.Model):
 
     created_at= models.DateTimeField(auto_now_add=True) # stores the timestamp when the rating was created
 
+    updated_at= models.DateTimeField(auto_now=True) # changes on every re-rate, the ML loader syncs ratings by it
+
     class Meta:
         unique_together = ('user', 'content_type', 'object_id')
+        indexes = [models.Index(fields=['updated_at', 'id'], name='dashboard_rating_updated_idx')]
     
     def __str__(self):
-        return f"Rating by {self.user} on {self.content_object}: {self.rating}"
\ No newline at end of file
+        return f"Rating by {self.user} on {self.content_object}: {self.rating}"
+
+# ------------------------
+# Precomputed recommendations
+# ------------------------
+class PrecomputedRecommendation(models.Model):
+    # top-N ids written by `manage.py precompute_recommendations`,
+    # recommend_view serves them while they are fresh and of the current model version
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    destination = models.ForeignKey(Destination, on_delete=models.CASCADE)
+    item_type = models.CharField(max_length=20)  # places, hotels, foods or activities
+    item_ids = models.JSONField(default=list)    # best first
+    model_version = models.CharField(max_length=64)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('user', 'destination', 'item_type')
+
+    def __str__(self):
+        return f"{self.item_type} for {self.user} in {self.destination}"
@@ -0,0 +1,56 @@
+# dashboard/signals.py
+
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from accounts.models import Destination, DestinationType
+from .models import Place, Hotel, Food, Activity, Favorite, Comment, Rating, PrecomputedRecommendation
+from .ml.snapshot import mark_stale
+from .ml.live import update_user
+from .ml.result_cache import invalidate_catalog, invalidate_user
+
+logger = logging.getLogger(__name__)
+
+# catalog models the recommender reads, a change to any of them makes the snapshot stale.
+# interactions are not in here: they are patched into the live scoring state
+# right away (see below) and reach the snapshot on its next TTL refresh
+SNAPSHOT_MODELS = (Destination, DestinationType, Place, Hotel, Food, Activity)
+
+# a user's own interactions, a change drops that user's precomputed and cached
+# recommendations and patches the user into the live scoring state of this worker
+INTERACTION_MODELS = (Favorite, Comment, Rating)
+
+
+def snapshot_model_changed(sender, **kwargs):
+    mark_stale()
+    # responses served straight from the database (ML_RECOMMEND_SOURCE='destination') are keyed on this
+    transaction.on_commit(invalidate_catalog)
+
+
+for model in SNAPSHOT_MODELS:
+    post_save.connect(snapshot_model_changed, sender=model, dispatch_uid=f"ml_snapshot_save_{model.__name__}")
+    post_delete.connect(snapshot_model_changed, sender=model, dispatch_uid=f"ml_snapshot_delete_{model.__name__}")
+
+
+def _update_live_user(user_id):
+    try:
+        update_user(user_id)
+    except Exception:
+        # the write itself succeeded, the next snapshot refresh picks it up anyway
+        logger.exception("Error updating recommendations of user %s", user_id)
+    finally:
+        # after the patch, so a request in between cannot cache the old answer under the new generation
+        invalidate_user(user_id)
+
+
+def interaction_changed(sender, instance, **kwargs):
+    PrecomputedRecommendation.objects.filter(user_id=instance.user_id).delete()
+    user_id = instance.user_id
+    transaction.on_commit(lambda: _update_live_user(user_id))
+
+
+for model in INTERACTION_MODELS:
+    post_save.connect(interaction_changed, sender=model, dispatch_uid=f"ml_precomputed_save_{model.__name__}")
+    post_delete.connect(interaction_changed, sender=model, dispatch_uid=f"ml_precomputed_delete_{model.__name__}")
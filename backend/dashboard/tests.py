@@ -1,3 +1,187 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.contrib.contenttypes.models import ContentType
+from django.test import SimpleTestCase, TestCase
+
+from accounts.models import CustomUser
+from .ml import dataLoader
+from .ml.clustering import fit_tier_model, weighted_quantiles
+from .ml.collaborative import (
+    calculate_user_neighbours, create_user_item_matrix, get_recommendations, rows_matrix, UserNeighbours,
+)
+from .ml.item_keys import ITEM_TYPE_CODES, encode_item_keys
+from .ml.live import LiveScoring
+from .models import Hotel, Rating
+
+
+def interactions(rows):
+    """Interaction frame of (user_id, item_type, item_id, score) tuples, as build_interactions returns it."""
+    return pd.DataFrame(rows, columns=["user_id", "item_type", "item_id", "score"])
+
+
+def hotel_keys(item_ids):
+    return encode_item_keys(np.full(len(item_ids), ITEM_TYPE_CODES["hotel"], dtype=np.int8),
+                            np.asarray(item_ids, dtype=np.int64))
+
+
+BASE_ROWS = [
+    (1, "hotel", 10, 5.0), (1, "hotel", 11, 3.0), (1, "hotel", 12, 4.0),
+    (2, "hotel", 10, 4.0), (2, "hotel", 13, 2.0), (2, "hotel", 14, 5.0),
+    (3, "hotel", 11, 1.0), (3, "hotel", 15, 4.0),
+    (4, "hotel", 12, 5.0), (4, "hotel", 13, 3.0), (4, "hotel", 15, 2.5), (4, "hotel", 16, 4.0),
+    (5, "hotel", 14, 3.0), (5, "hotel", 16, 5.0), (5, "hotel", 17, 2.0),
+]
+
+
+class UserItemMatrixTests(SimpleTestCase):
+
+    def test_matches_pivot_table(self):
+        df = interactions(BASE_ROWS + [(1, "hotel", 10, 3.0), (2, "place", 10, 2.0), (2, "place", 10, 4.5)])
+        user_item_matrix = create_user_item_matrix(df)
+
+        expected = df.pivot_table(index="user_id", columns=["item_type", "item_id"], values="score", aggfunc="mean")
+        expected = expected.stack(["item_type", "item_id"]).dropna().to_dict()
+        coo = user_item_matrix.matrix.tocoo()
+        type_names = {code: name for name, code in ITEM_TYPE_CODES.items()}
+        actual = {
+            (user_item_matrix.user_ids[row], type_names[user_item_matrix.item_types[col]],
+             user_item_matrix.item_ids[col]): value
+            for row, col, value in zip(coo.row, coo.col, coo.data)
+        }
+        self.assertEqual(set(actual), set(expected))
+        for key, value in expected.items():
+            self.assertAlmostEqual(actual[key], value, places=5)
+
+    def test_count_weights_like_repeated_rows(self):
+        weighted = interactions([(1, "hotel", 10, 5.0), (1, "hotel", 10, 2.0)]).assign(count=[2.0, 1.0])
+        repeated = interactions([(1, "hotel", 10, 5.0), (1, "hotel", 10, 5.0), (1, "hotel", 10, 2.0)])
+        self.assertAlmostEqual(create_user_item_matrix(weighted).matrix[0, 0], 4.0, places=5)
+        self.assertAlmostEqual(create_user_item_matrix(repeated).matrix[0, 0], 4.0, places=5)
+
+
+class LiveScoringTests(SimpleTestCase):
+    """A user patched into the live state scores like a full rebuild with their new row."""
+
+    def setUp(self):
+        self.user_item_matrix = create_user_item_matrix(interactions(BASE_ROWS))
+        self.state = LiveScoring(1, "test", None, self.user_item_matrix,
+                                 calculate_user_neighbours(self.user_item_matrix, k=3))
+        self.k = self.state.neighbours_k()
+
+    def rebuilt(self, user_id, new_rows):
+        rows = [row for row in BASE_ROWS if row[0] != user_id] + new_rows
+        return create_user_item_matrix(interactions(rows))
+
+    def assert_patch_matches_rebuild(self, user_id, item_ids, scores):
+        keys, scores = hotel_keys(item_ids), np.asarray(scores, dtype=np.float32)
+        self.state.patches[user_id] = self.state.patch(user_id, keys, scores)
+        rebuilt = self.rebuilt(user_id, [(user_id, "hotel", item_id, score) for item_id, score in zip(item_ids, scores)])
+
+        row_keys, row_scores = self.state.row(user_id)
+        np.testing.assert_array_equal(row_keys, keys)
+        np.testing.assert_allclose(row_scores, scores)
+
+        neighbour_ids, sims = self.state.patches[user_id].neighbours
+        expected = calculate_user_neighbours(rebuilt, k=self.k, user_ids=[user_id])
+        expected_ids, expected_sims = expected.neighbours_of(user_id)
+        np.testing.assert_array_equal(neighbour_ids, expected_ids)
+        np.testing.assert_allclose(sims, expected_sims, rtol=1e-5)
+
+        # scored from just the user's and their neighbours' rows, as live_scoring_inputs hands them out
+        user_ids = [user_id, *neighbour_ids.tolist()]
+        partial = rows_matrix(user_ids, [self.state.row(other) for other in user_ids])
+        neighbours = UserNeighbours([user_id], [0, len(neighbour_ids)], neighbour_ids, sims)
+        items, item_scores = get_recommendations(user_id, partial, neighbours, top_n=5, category="hotel",
+                                                 return_scores=True)
+        expected_items, expected_scores = get_recommendations(user_id, rebuilt, expected, top_n=5, category="hotel",
+                                                              return_scores=True)
+        self.assertEqual(items, expected_items)
+        np.testing.assert_allclose(item_scores, expected_scores, rtol=1e-5)
+
+    def test_changed_row(self):
+        self.assert_patch_matches_rebuild(3, [11, 15, 16], [2.0, 4.0, 5.0])
+
+    def test_new_user(self):
+        self.assert_patch_matches_rebuild(9, [10, 14], [5.0, 4.0])
+
+    def test_base_is_left_alone(self):
+        matrix = self.user_item_matrix.matrix.copy()
+        self.state.patches[1] = self.state.patch(1, hotel_keys([17]), np.array([1.0], dtype=np.float32))
+        self.assertEqual((self.user_item_matrix.matrix != matrix).nnz, 0)
+        row_keys, _ = self.user_item_matrix.row_items(self.user_item_matrix.row_of(1))
+        np.testing.assert_array_equal(row_keys, hotel_keys([10, 11, 12]))
+
+
+class InteractionSyncTests(TestCase):
+
+    def setUp(self):
+        dataLoader.reset_interaction_sync()
+        self.addCleanup(dataLoader.reset_interaction_sync)
+        self.user = CustomUser.objects.create(username="rater", email="rater@example.com", phone_number="100")
+        self.hotel_type = ContentType.objects.get_for_model(Hotel)
+
+    def rate(self, object_id, rating):
+        return Rating.objects.create(user=self.user, content_type=self.hotel_type, object_id=object_id, rating=rating)
+
+    def sync(self):
+        changed = dataLoader.sync_interaction_table("dashboard_rating")
+        return changed, dataLoader.interaction_frames["dashboard_rating"]
+
+    def test_new_and_edited_rows_are_merged(self):
+        first, second = self.rate(1, 4), self.rate(2, 3)
+        changed, frame = self.sync()
+        self.assertTrue(changed)
+        self.assertEqual(sorted(frame["id"].tolist()), sorted([first.id, second.id]))
+
+        changed, unchanged = self.sync()
+        self.assertFalse(changed)
+        self.assertIs(unchanged, frame)
+
+        first.rating = 1
+        first.save()
+        changed, frame = self.sync()
+        self.assertTrue(changed)
+        self.assertEqual(len(frame), 2)
+        # the edited row replaced its old version and, being the newest, went last
+        self.assertEqual(frame["id"].tolist()[-1], first.id)
+        self.assertEqual(frame.set_index("id").loc[first.id, "rating"], 1)
+
+    def test_deletes_are_noticed_by_the_fingerprint_check(self):
+        kept, deleted = self.rate(1, 4), self.rate(2, 3)
+        self.sync()
+        deleted.delete()
+
+        # within the interval the watermark sees nothing new and the rows are kept
+        changed, frame = self.sync()
+        self.assertFalse(changed)
+        self.assertEqual(len(frame), 2)
+
+        with mock.patch.object(dataLoader, "FINGERPRINT_INTERVAL", 0):
+            changed, frame = self.sync()
+        self.assertTrue(changed)
+        self.assertEqual(frame["id"].tolist(), [kept.id])
+
+
+class TierModelTests(SimpleTestCase):
+
+    def tiers(self, prices):
+        df = pd.DataFrame({"id": range(len(prices)), "price_range": prices})
+        return fit_tier_model(df, ["price_range"]).assign(df).tolist()
+
+    def test_weighted_quantiles_interpolate_between_middles(self):
+        cutpoints = weighted_quantiles(np.arange(1.0, 7.0), np.ones(6), [1 / 3, 2 / 3])
+        np.testing.assert_allclose(cutpoints, [2.5, 4.5])
+
+    def test_evenly_spaced(self):
+        self.assertEqual(self.tiers([10, 20, 30, 40, 50, 60]), [0, 0, 1, 1, 2, 2])
+
+    def test_all_equal_go_to_the_middle(self):
+        self.assertEqual(self.tiers([100] * 5), [1] * 5)
+
+    def test_repeated_middle_value(self):
+        self.assertEqual(self.tiers([50, 100, 100, 100, 200]), [0, 1, 1, 1, 2])
+
+    def test_two_items(self):
+        self.assertEqual(self.tiers([50, 100]), [0, 2])
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PlaceViewSet, HotelViewSet, FoodViewSet, ActivityViewSet, FavoriteViewSet, CommentViewSet, recommend_view  , SubmitRatingView   
+from .views import PlaceViewSet, HotelViewSet, FoodViewSet, ActivityViewSet, FavoriteViewSet, CommentViewSet, recommend_view, recommend_all_view, SubmitRatingView, loader_stats_view
 
 router = DefaultRouter()
 router.register(r'places', PlaceViewSet)
@@ -14,6 +14,8 @@ router.register(r'comments', CommentViewSet)
 urlpatterns = [
     path('', include(router.urls)), # this is for viewsets
     path('recommend/', recommend_view, name='recommend'), # this is for recommendation API
+    path('recommend/all/', recommend_all_view, name='recommend_all'), # every item type of a destination in one call
     path ('rate/', SubmitRatingView.as_view(), name='submit_rating'), # this is for rating items
+    path('ml/loader-stats/', loader_stats_view, name='ml_loader_stats'), # staff only loader timings
 
 ]
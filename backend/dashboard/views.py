@@ -2,7 +2,7 @@
 
 # ------------------- DRF imports -------------------
 from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 
@@ -17,16 +17,24 @@ from rest_framework import status,permissions
 from accounts.models import Destination, DestinationType
 
 # ------------------- Models and serializers -------------------
-from .models import Place, Hotel, Food, Activity, Favorite, Comment
+from .models import Place, Hotel, Food, Activity, Favorite, Comment, PrecomputedRecommendation
 from .serializers import (
     PlaceSerializer, HotelSerializer, FoodSerializer, ActivitySerializer,
     FavoriteSerializer, CommentSerializer
 )
 
 # ------------------- ML helpers -------------------
-from .ml.dataLoader import load_all_data
-from .ml.clustering import cluster_for_dashboard
-from .ml.collaborative import build_interactions, create_user_item_matrix, calculate_user_similarity, get_recommendations
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .ml.dataLoader import load_destination_data
+from .ml.snapshot import get_snapshot, current_snapshot
+from .ml.instrumentation import loader_stats
+from .ml.clustering import cluster_for_dashboard, cluster_model_for
+from .ml.pipeline import ITEM_TYPE_CONFIG, destination_items, scoring_inputs, recommend_ids, model_version
+from .ml.live import live_scoring_inputs
+from .ml.result_cache import result_keys, get_results, set_result
+from .ml.responses import build_items, in_order, with_display_columns
 
 
 # ------------------- CRUD APIs -------------------
@@ -136,114 +144,168 @@ class SubmitRatingView(APIView):
 
         return Response({"message": "Rating submitted successfully"}, status=status.HTTP_200_OK)
 
+# ------------------- ML loader stats -------------------
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def loader_stats_view(request):
+    """Per-table load timings, rows, memory and cache hits of the worker answering the request (staff only)."""
+    stats = loader_stats()
+    snapshot = current_snapshot()
+    stats["snapshot"] = None if snapshot is None else {
+        "version": snapshot.version,
+        "source": snapshot.source,
+        "age_seconds": snapshot.age,
+    }
+    return Response(stats, status=200)
+
 # ------------------- Recommendation API -------------------
 
+# item_type -> model and serializer of the response
+ITEM_MODELS = {
+    "places": (Place, PlaceSerializer),
+    "hotels": (Hotel, HotelSerializer),
+    "foods": (Food, FoodSerializer),
+    "activities": (Activity, ActivitySerializer),
+}
+
+
+def precomputed_ids(user_id, destination_id, item_types):
+    """
+    item_type -> ids stored by `manage.py precompute_recommendations`, for the
+    item_types whose rows are still fresh and of the current model.
+    """
+    max_age = getattr(settings, "ML_PRECOMPUTED_MAX_AGE", 3600)
+    return dict(PrecomputedRecommendation.objects.filter(
+        user_id=user_id, destination_id=destination_id, item_type__in=item_types,
+        model_version=model_version(), computed_at__gte=timezone.now() - timedelta(seconds=max_age),
+    ).values_list("item_type", "item_ids"))
+
+
+BADGE_MAPPING = {
+    0: "Budget",
+    1: "Mid range",
+    2: "Luxury",
+}
+
+
+def recommendation_data(user_id, destination_id, item_types):
+    """
+    item_type -> recommend_view response data for one user and destination.
+    Cached answers are reused, for the other item types the frames are read
+    and the user's scoring inputs (their row and neighbourhood) prepared
+    once, then every item type is ranked from them. None when the
+    destination does not exist.
+    """
+    snapshot = None
+    if getattr(settings, "ML_RECOMMEND_SOURCE", "snapshot") != "destination":
+        # current catalog snapshot, refreshed in the background
+        snapshot = get_snapshot()
+        # not in the snapshot: unknown, or created since it was built
+        if (destination_id not in snapshot.destinations["id"].to_numpy()
+                and not Destination.objects.filter(id=destination_id).exists()):
+            return None
+
+    # same answer as last time while model, catalog and the user's interactions are unchanged
+    cache_keys = result_keys(user_id, destination_id, item_types, model_version(),
+                             snapshot.cache_version if snapshot is not None else None)
+    results = get_results(cache_keys)
+    missing = [item_type for item_type in item_types if item_type not in results]
+    if not missing:
+        return results
+
+    # batch precomputed top-N, one indexed lookup
+    precomputed = precomputed_ids(user_id, destination_id, missing)
+
+    if snapshot is None:
+        # read only this destination's items and interactions from the db
+        destinations, destination_types, places_df, activities_df, foods_df, hotels_df, user_interactions = load_destination_data(destination_id)
+        if destinations.empty:
+            return None
+    else:
+        destinations, destination_types, places_df, activities_df, foods_df, hotels_df, user_interactions = snapshot.as_tuple()
+
+    scoring = None
+    for item_type in missing:
+        model, serializer_class = ITEM_MODELS[item_type]
+        # filter items by destination
+        df_filtered = destination_items(places_df, hotels_df, foods_df, activities_df, destination_id, item_type)
+        category_prefix, numeric_features = ITEM_TYPE_CONFIG[item_type]
+
+        # an empty stored list is no answer either, the destination is clustered instead
+        ids, scores = precomputed.get(item_type) or None, None
+        if ids is None:
+            if scoring is None:
+                # preparing user interactions for collaborative filtering, shared by every item type
+                if snapshot is not None:
+                    # kept per snapshot, new interactions are patched in by the model signals
+                    scoring = live_scoring_inputs(snapshot, user_id)
+                else:
+                    scoring = scoring_inputs(user_interactions, user_id=user_id)
+
+            # collaborative filtering recommendations
+            recommended = recommend_ids(
+                user_id, destination_id, category_prefix, df_filtered["id"].to_numpy(),
+                *scoring, top_n=10, return_scores=True
+            )
+            if recommended is not None:
+                ids, scores = recommended[0], dict(zip(*recommended))
+
+        # fitted once per destination and item type, refitted when its catalog changes
+        cluster_model = cluster_model_for(destination_id, item_type, df_filtered, numeric_features, n_clusters=3,
+                                          mode=getattr(settings, "ML_CLUSTER_MODE", "kmeans"))
+
+        if ids is not None:
+            # user has previous interactions so cf, best first
+            df_filtered = in_order(df_filtered, ids)
+        else:
+            # no interactions then clustering of the whole destination
+            df_filtered = df_filtered.sort_values("id")
+        df_clustered = cluster_for_dashboard(df_filtered, numeric_features, n_clusters=3,
+                                             badge_mapping=BADGE_MAPPING, model=cluster_model)
+
+        # items straight from the frames, display columns they lack read in one query
+        items = build_items(df_clustered, serializer_class.Meta.fields, category_prefix, user_interactions, scores)
+        if items is None:
+            df_clustered = with_display_columns(model, df_clustered, serializer_class.Meta.fields)
+            items = build_items(df_clustered, serializer_class.Meta.fields, category_prefix, user_interactions, scores)
+
+        results[item_type] = {
+            "user_id": user_id,
+            "destination_id": destination_id,
+            "item_type": item_type,
+            "clustered_data": items,
+        }
+        if item_type in cache_keys:
+            set_result(cache_keys[item_type], results[item_type])
+    return results
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def recommend_view(request):
    
    user_id=request.user.id
-   # load all data from db to dataframes
-   destinations, destination_types,places_df, activities_df, foods_df, hotels_df, user_interactions = load_all_data()
    destination_id = request.GET.get("dest_id") or request.GET.get("destination_id")
    item_type = request.GET.get("item_type", "places")
 
 
    if not destination_id:
-       return Response({"error":" Please select a destination first."}, staus=404)
-
-   destination_id = int(destination_id)
-
-   # filter items by destination
-   if item_type == "places":
-       
-       df_filtered = places_df[places_df["destination_id"] == destination_id]
-       numeric_features = ["rating"]
-       category_prefix="place"
-
-   elif item_type == "hotels":
-        df_filtered = hotels_df[hotels_df["place_id"].isin(
-            places_df[places_df["destination_id"] == destination_id]["id"]
-        )]
-        numeric_features = ["rating", "price_range"]
-        category_prefix="hotel"
-
-   elif item_type == "foods":
-        df_filtered = foods_df[foods_df["place_id"].isin(
-            places_df[places_df["destination_id"] == destination_id]["id"]
-        )]
-        numeric_features = ["rating", "price_range"]
-        category_prefix="food"
-
-   elif item_type == "activities":
-        df_filtered = activities_df[activities_df["place_id"].isin(
-            places_df[places_df["destination_id"] == destination_id]["id"]
-        )]
-        numeric_features = ["rating", "price_range"]
-        category_prefix="activity"
-
-   else:
+       return Response({"error":" Please select a destination first."}, status=404)
+
+   try:
+       destination_id = int(destination_id)
+   except ValueError:
+       return Response({"error": "Invalid dest_id"}, status=400)
+
+   if item_type not in ITEM_TYPE_CONFIG:
         return Response({"error": "Invalid item_type"}, status=400)
-   
-   
-      
-   # preparing user interactions for collaborative filtering
-
-   user_favorites = user_interactions.get("favorites", [])
-   user_ratings = user_interactions.get("ratings", [])
-   user_comments = user_interactions.get("comments", [])
-   destination_links = user_interactions.get("destination_links", {})
-   place_links = user_interactions.get("place_links", {})
-
-   # build interactions dataframe
-
-   interactions_df = build_interactions(
-       user_favorites, user_ratings, user_comments,
-       destination_links, place_links)
-   user_item_matrix= create_user_item_matrix(interactions_df)
-   user_similarity= calculate_user_similarity(user_item_matrix)
-
-   # collaborative filtering recommendations
-
-   if user_id in user_item_matrix.index and user_item_matrix.loc[user_id].sum()>0:
-       # user has previous interactions so cf
-       cf_recommendations_ids= get_recommendations(
-           user_id, user_item_matrix, user_similarity,
-           top_n=10, category=category_prefix
-       )
-
-       df_filtered= df_filtered[df_filtered["id"].isin(cf_recommendations_ids)]
-   else:
-       # no interactions then clustering
-        badge_mapping={
-        0:"Budget",
-        1:"Mid range",
-        2:"Luxury"
-    }
-   df_clustered=cluster_for_dashboard(df_filtered,numeric_features, n_clusters=3, badge_mapping=badge_mapping)
-      
-    # convert df to django orm for the serialization and returing responses
-   ids = df_filtered["id"].tolist()
-   if item_type == "places":
-        queryset = Place.objects.filter(id__in=ids)
-        serializer = PlaceSerializer(queryset, many=True)
-   elif item_type == "hotels":
-        queryset = Hotel.objects.filter(id__in=ids)
-        serializer = HotelSerializer(queryset, many=True)
-   elif item_type == "foods":
-        queryset = Food.objects.filter(id__in=ids)
-        serializer = FoodSerializer(queryset, many=True)
-   elif item_type == "activities":
-        queryset = Activity.objects.filter(id__in=ids)
-        serializer = ActivitySerializer(queryset, many=True)
-   
+
    # return the response to the fluter frontend
-   return Response({
-        "user_id": user_id,
-        "destination_id": destination_id,
-        "item_type": item_type,
-        "clustered_data": serializer.data
-    }, status=200)
+   data = recommendation_data(user_id, destination_id, [item_type])
+   if data is None:
+       return Response({"error": "Destination not found"}, status=404)
+   return Response(data[item_type], status=200)
 
 
 
@@ -254,8 +316,37 @@ def recommend_view(request):
    """  
    here the data is loaded from database into the dataframes as python objects
    and clustering is applied to them 
-   then this data is fetched using orm using clustered ids
-   serialize and returned  as json responses to use by flutter
+   then the items are built from those frames in recommendation order
+   (the orm only serializes them when the frames lack display columns)
+   and returned  as json responses to use by flutter
    """
 
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def recommend_all_view(request):
+    """
+    Places, hotels, foods and activities of a destination in one response,
+    ranked from one pipeline run instead of one recommend_view call each.
+    """
+    user_id = request.user.id
+    destination_id = request.GET.get("dest_id") or request.GET.get("destination_id")
+    if not destination_id:
+        return Response({"error": " Please select a destination first."}, status=404)
+
+    try:
+        destination_id = int(destination_id)
+    except ValueError:
+        return Response({"error": "Invalid dest_id"}, status=400)
+
+    results = recommendation_data(user_id, destination_id, list(ITEM_TYPE_CONFIG))
+    if results is None:
+        return Response({"error": "Destination not found"}, status=404)
+    return Response({
+        "user_id": user_id,
+        "destination_id": destination_id,
+        "results": {item_type: data["clustered_data"] for item_type, data in results.items()},
+    }, status=200)
+
+
     
\ No newline at end of file
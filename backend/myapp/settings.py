@@ -100,9 +100,39 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),  # Use environment variable for security
         'HOST': 'localhost',
         'PORT': '5432',
+        'CONN_MAX_AGE': 60,  # reuse connections across requests instead of reconnecting each time
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Caches
+# 'recommendations' holds recommend_view responses (see dashboard/ml/result_cache.py):
+# entries expire after TIMEOUT seconds and the least recently used go first past MAX_ENTRIES.
+# Responses served from a worker's snapshot are keyed per worker (its snapshot
+# and live state are its own), so sharing this cache between workers through
+# redis/memcached only shares those served from the database (ML_RECOMMEND_SOURCE='destination').
+# 'ml-generations' holds the tokens that invalidate those responses when a user's
+# interactions or the catalog change. It must be shared by every worker, the
+# write happens in one of them (its table is created by the dashboard migrations)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recommendations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ml-recommendations',
+        'TIMEOUT': 600,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'ml-generations': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'ml_generation_cache',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -144,6 +174,19 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# ML recommender
+ML_SNAPSHOT_TTL = 300  # seconds a catalog snapshot is served before it is rebuilt in the background
+ML_SNAPSHOT_DIR = os.getenv('ML_SNAPSHOT_DIR')  # dir written by `manage.py dump_ml_snapshot`, workers mmap it when set
+ML_LOADER_THREADS = 4  # tables read in parallel by the ML loader
+ML_RECOMMEND_SOURCE = 'snapshot'  # 'snapshot' serves from memory, 'destination' reads just the requested destination per call
+ML_MODEL_DIR = os.getenv('ML_MODEL_DIR', str(BASE_DIR / 'ml_models'))  # models written by the offline build commands
+ML_CF_MODE = 'neighbours'  # 'neighbours' scores from the user's top-k similar users, 'full' builds the whole user x user matrix, 'items' uses the item neighbours of `manage.py build_item_neighbours`, 'als' the factors of `manage.py train_als`
+ML_CF_NEIGHBOURS = 50  # k of the top-k user and item neighbourhoods
+ML_ALS_FACTORS = 32  # latent factors per user and item of the ALS model
+ML_PRECOMPUTED_MAX_AGE = 3600  # seconds rows of `manage.py precompute_recommendations` are served before scoring online again
+ML_CLUSTER_MODE = 'kmeans'  # badge clusters: 'kmeans' full batch fit, 'minibatch' chunked partial_fit with incremental updates for new items, 'quantile' rating-weighted price tiers (no fit)
+ML_ANN_NPROBE = 4  # inverted lists searched per query in the ALS item index, higher is better recall but slower
+
 # Django REST Framework JWT setup
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
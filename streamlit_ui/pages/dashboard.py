@@ -1,3 +1,5 @@
+import time
+
 import streamlit as st
 import requests
 from utils.api import fetch_data
@@ -41,16 +43,23 @@ mapping = {
 
 current_map = mapping[choice]
 
+# seconds the ML recommendations of a destination are reused before fetching them again
+RECOMMENDATIONS_TTL = 60
+
 with st.spinner(f"Fetching {choice}..."):
     if view_mode == "AI Recommendations (ML)":
-        # Calls your @api_view recommend_view
-        params = {
-            "item_type": current_map["type"], 
-            "dest_id": dest_id  # Matches our updated Django View
-        }
-        response = fetch_data("dashboard/recommend/", params=params)
-        # Your ML view returns data inside a 'clustered_data' key
-        items = response.get("clustered_data", []) if isinstance(response, dict) else []
+        # Calls recommend_all_view once for every category of the destination,
+        # switching categories then reuses it for RECOMMENDATIONS_TTL seconds or
+        # until a rating is saved (changes made elsewhere show up after the TTL)
+        recommendations_key = f"recommendations_{dest_id}"
+        fetched_at, results = st.session_state.get(recommendations_key, (0.0, None))
+        if results is None or time.time() - fetched_at > RECOMMENDATIONS_TTL:
+            response = fetch_data("dashboard/recommend/all/", params={"dest_id": dest_id})
+            if isinstance(response, dict):
+                results = response.get("results", {})
+                st.session_state[recommendations_key] = (time.time(), results)
+        # each category holds the same items recommend_view returns in 'clustered_data'
+        items = (results or {}).get(current_map["type"], [])
     else:
         # Calls your standard ViewSets with filtering
         items = fetch_data(current_map["url"], params={"dest_id": dest_id})
@@ -101,6 +110,8 @@ else:
                         )
                         if res.status_code == 200:
                             st.toast(f"✅ Rated {item['name']} {user_rating + 1} stars!")
+                            # the rating changes the recommendations, fetch them again next time
+                            st.session_state.pop(f"recommendations_{dest_id}", None)
                         else:
                             st.error("Could not save rating.")
                     except Exception as e: